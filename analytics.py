@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+#
+#############
+# Analytics #
+#############
+#
+# Description: Rolling averages, per 100k rates, week over week growth and
+# doubling time for every state (or county) at once. The arrays already hold
+# cumulative counts, so a k day average at any row is just
+# (cum[row] - cum[row - k]) / k, no per window loops
+#
+import numpy as np
+
+# Rolling windows in days (the 30 day average is in the state summary,
+# see metrics.py, and the keys would clash)
+WINDOWS = [7, 14]
+
+
+def average_at(cum, rows, starts, k):
+
+    # k day average ending at each of `rows` (one per state), nan where the
+    # window reaches back past the state's first row
+    back = rows - k
+    valid = back >= starts
+
+    out = np.full(len(rows), np.nan)
+    out[valid] = (cum[rows[valid]] - cum[back[valid]]) / k
+
+    return out
+
+
+def build_analytics(table, population=None):
+
+    # Only the last row of each state (and the one a week before) is ever
+    # shown, so the windows are worked out there and nowhere else
+    arrays = table.arrays
+
+    starts = arrays['starts']
+    last = arrays['ends'] - 1
+
+    # Population lined up with the states, missing ones are nan
+    if population is not None:
+        pop = population.reindex(table.names).values.astype('float64')
+
+    values = {}
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        for column in ['cases', 'deaths']:
+            cum = arrays[column].astype('float64')
+
+            for k in WINDOWS:
+                values['{}_average_{}'.format(column, k)] = np.round(average_at(cum, last, starts, k))
+
+            # This week's average against last week's
+            week = average_at(cum, last, starts, 7)
+            prev = average_at(cum, last - 7, starts, 7)
+            values[column + '_week_growth'] = np.round((week - prev) / prev * 100, 2)
+
+            # Days to double at last week's growth rate, unknown when there
+            # was nothing a week ago
+            before = cum[np.maximum(last - 7, starts)]
+            ratio = cum[last] / before
+            doubling = 7 * np.log(2) / np.log(ratio)
+            doubling = np.where(ratio > 1, doubling, np.inf)
+            values[column + '_doubling'] = np.round(np.where((before == 0) & (cum[last] > 0), np.nan, doubling), 1)
+
+            if population is not None:
+                values[column + '_per_100k'] = np.round(cum[last] / pop * 100000, 1)
+                values[column + '_average_7_per_100k'] = np.round(week / pop * 100000, 2)
+
+    summary = {}
+
+    for i, name in enumerate(table.names):
+        summary[name] = {key: v[i] for key, v in values.items()}
+
+    return {'summary': summary}
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+#
+#######
+# API #
+#######
+#
+# Description: Read only data endpoints on the flask server, for anyone who
+# wants the numbers rather than the dashboard. Each one streams csv (the
+# default) or ndjson (?format=ndjson) a chunk of rows at a time straight from
+# the loaded Dataset, with an ETag and Last-Modified from the data version so
+# pulling unchanged data again is a 304
+#
+#   /api/usa/summary              totals and 5 day change, as on the USA tab
+#   /api/usa/daily                new cases and deaths per day
+#   /api/states/metrics           the state tab's numbers for every state
+#   /api/states/daily             every state's daily rows
+#   /api/states/<state>/metrics   the state tab's numbers for one state
+#   /api/states/<state>/daily     one state's daily rows
+#
+import io
+import csv
+import math
+
+import flask
+
+import transport
+
+# Rows per chunk sent
+CHUNK_ROWS = 2000
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Daily rows, counts are the corrected ones with the raw counts and
+# correction flags next to them (see clean.py)
+DAILY = ['state', 'date', 'cases', 'deaths', 'new_cases', 'new_deaths', 'raw_cases', 'raw_deaths', 'flags']
+
+#################
+# Rows          #
+#################
+
+def daily_rows(arrays, rows):
+
+    import numpy as np
+
+    names = arrays['names']
+
+    for start in range(rows.start, rows.stop, CHUNK_ROWS):
+        chunk = slice(start, min(start + CHUNK_ROWS, rows.stop))
+
+        columns = [
+            [names[code] for code in arrays['state'][chunk]],
+            np.datetime_as_string(arrays['date'][chunk], unit='D').tolist(),
+            ] + [arrays[c][chunk].tolist() for c in DAILY[2:]]
+
+        yield from zip(*columns)
+
+
+def metrics_row(data, name):
+
+    # The summary then the rolling numbers, as one dict so a key can
+    # only be there once
+    return dict(data.state_metrics['summary'][name], **data.analytics['summary'][name])
+
+
+def metrics_columns(data):
+
+    # Same keys for every state
+    return ['state'] + list(metrics_row(data, data.state_metrics['states'][0]))
+
+
+def metrics_rows(data, names):
+
+    for name in names:
+        yield [name] + list(metrics_row(data, name).values())
+
+#################
+# Formats       #
+#################
+
+def cell(value):
+
+    # nan (not enough days) and inf (not growing) as empty cells,
+    # whole counts without the .0
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return ''
+
+        if value.is_integer():
+            return int(value)
+
+    return value
+
+
+def stream_csv(columns, rows):
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    writer.writerow(columns)
+
+    for i, row in enumerate(rows, 1):
+        writer.writerow([cell(v) for v in row])
+
+        if i % CHUNK_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+
+    yield buf.getvalue()
+
+
+def stream_ndjson(columns, rows):
+
+    lines = []
+
+    for row in rows:
+        lines.append(transport.dumps(dict(zip(columns, row))))
+
+        if len(lines) == CHUNK_ROWS:
+            yield b'\n'.join(lines) + b'\n'
+            lines = []
+
+    if lines:
+        yield b'\n'.join(lines) + b'\n'
+
+
+def respond(data, columns, rows, max_age=300):
+
+    fmt = flask.request.args.get('format', 'csv')
+
+    if fmt not in FORMATS:
+        flask.abort(400, 'format must be one of {}'.format(', '.join(FORMATS)))
+
+    body = stream_csv(columns, rows) if fmt == 'csv' else stream_ndjson(columns, rows)
+
+    # Nothing is read from `rows` until the body is sent, a 304 never does
+    response = flask.Response(body, mimetype=FORMATS[fmt])
+    response.set_etag('{}-{}'.format(data.version, fmt))
+    response.last_modified = data.modified
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+
+    return response.make_conditional(flask.request)
+
+#################
+# Routes        #
+#################
+
+def install(server, get_data):
+
+    def state_or_404(data, state):
+
+        if state not in data.table:
+            flask.abort(404, 'no state named {}'.format(state))
+
+    @server.route('/api/usa/summary')
+    def usa_summary():
+
+        data = get_data()
+        usa = data.usa_metrics
+
+        columns = ['date', 'cases_total', 'deaths_total', 'cases_change_5', 'deaths_change_5']
+        # The last day as in /api/usa/daily (data.date is the page's MM-DD-YYYY)
+        row = [usa['daily'].index[-1].strftime('%Y-%m-%d')] + [usa[c] for c in columns[1:]]
+
+        return respond(data, columns, iter([row]))
+
+    @server.route('/api/usa/daily')
+    def usa_daily():
+
+        data = get_data()
+        daily = data.usa_metrics['daily']
+
+        rows = zip(daily.index.strftime('%Y-%m-%d'), daily['cases'].astype('int64').tolist(), daily['deaths'].astype('int64').tolist())
+
+        return respond(data, ['date', 'new_cases', 'new_deaths'], rows)
+
+    @server.route('/api/states/metrics')
+    def states_metrics():
+
+        data = get_data()
+
+        return respond(data, metrics_columns(data), metrics_rows(data, data.state_metrics['states']))
+
+    @server.route('/api/states/daily')
+    def states_daily():
+
+        data = get_data()
+
+        return respond(data, DAILY, daily_rows(data.arrays, slice(0, len(data.arrays['date']))))
+
+    @server.route('/api/states/<state>/metrics')
+    def state_metrics(state):
+
+        data = get_data()
+        state_or_404(data, state)
+
+        return respond(data, metrics_columns(data), metrics_rows(data, [state]))
+
+    @server.route('/api/states/<state>/daily')
+    def state_daily(state):
+
+        data = get_data()
+        state_or_404(data, state)
+
+        return respond(data, DAILY, daily_rows(data.arrays, data.table.rows(state)))
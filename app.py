@@ -9,113 +9,49 @@
 # Description: Pulls data from mytimes github and uses dash to display charts and graphs 
 # analyzing the data by the US and each individual state
 #
-import pandas as pd
-import numpy as np
-import datetime 
+import os
+import math
+import time
+import threading
 
+# Import time, for the startup gauge at the bottom
+started = time.perf_counter()
+
+import flask
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
-import plotly.express as px
-
-# Read csv file from github
-# State Data
-url = 'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-states.csv'
-
-df_states = pd.read_csv(url)
-
-# Read csv file from github
-# County Data
-
-#state Codes
-us_state_abbrev = {
-    'Alabama': 'AL',
-    'Alaska': 'AK',
-    'American Samoa': 'AS',
-    'Arizona': 'AZ',
-    'Arkansas': 'AR',
-    'California': 'CA',
-    'Colorado': 'CO',
-    'Connecticut': 'CT',
-    'Delaware': 'DE',
-    'District of Columbia': 'DC',
-    'Florida': 'FL',
-    'Georgia': 'GA',
-    'Guam': 'GU',
-    'Hawaii': 'HI',
-    'Idaho': 'ID',
-    'Illinois': 'IL',
-    'Indiana': 'IN',
-    'Iowa': 'IA',
-    'Kansas': 'KS',
-    'Kentucky': 'KY',
-    'Louisiana': 'LA',
-    'Maine': 'ME',
-    'Maryland': 'MD',
-    'Massachusetts': 'MA',
-    'Michigan': 'MI',
-    'Minnesota': 'MN',
-    'Mississippi': 'MS',
-    'Missouri': 'MO',
-    'Montana': 'MT',
-    'Nebraska': 'NE',
-    'Nevada': 'NV',
-    'New Hampshire': 'NH',
-    'New Jersey': 'NJ',
-    'New Mexico': 'NM',
-    'New York': 'NY',
-    'North Carolina': 'NC',
-    'North Dakota': 'ND',
-    'Northern Mariana Islands':'MP',
-    'Ohio': 'OH',
-    'Oklahoma': 'OK',
-    'Oregon': 'OR',
-    'Pennsylvania': 'PA',
-    'Puerto Rico': 'PR',
-    'Rhode Island': 'RI',
-    'South Carolina': 'SC',
-    'South Dakota': 'SD',
-    'Tennessee': 'TN',
-    'Texas': 'TX',
-    'Utah': 'UT',
-    'Vermont': 'VT',
-    'Virgin Islands': 'VI',
-    'Virginia': 'VA',
-    'Washington': 'WA',
-    'West Virginia': 'WV',
-    'Wisconsin': 'WI',
-    'Wyoming': 'WY'
-}
-
-url2 = 'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-counties.csv'
-
-df = pd.read_csv(url2)
-
-# Filter for last date
-today = df['date'].iloc[-1]
-
-df = df[df['date'] == today]
-
-df = df.replace(us_state_abbrev)
-
-df = df.groupby('state')['cases'].sum()
-
-# Plot
-fig = px.choropleth(df, locations=df.index,
-        scope='usa',
-        color='cases',
-        locationmode='USA-states',
-        range_color=(0,1000000),
-        title='Cases per State',
-        )
-
-# Create Date objects
-
-df_states['date'] = pd.to_datetime(df_states['date'])
-
-date = df_states['date'].iloc[-1]
-date = date.strftime('%m-%d-%Y')
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
+
+import api
+import cache
+import counties
+import dataset
+import instrument
+import maps
+import transport
+
+# The data is loaded by dataset.start_refresher() at the bottom, or in the
+# background with LAZY_START=1 (see dataset.py)
+
+# Rendered tab layouts, keyed by (data version, tab), the lock keeps
+# threads (gthread workers) from pruning it while another adds to it
+tab_cache = {}
+tab_lock = threading.Lock()
+
+# State series and map responses, cached per data version and shared between
+# workers through data/cache (see cache.py)
+FIGURE_CACHE = os.environ.get('FIGURE_CACHE', '1') == '1'
+FIGURE_CACHE_TTL = int(os.environ.get('FIGURE_CACHE_TTL', 0)) or None
+
+figure_cache = cache.ResponseCache(maxsize=1024, ttl=FIGURE_CACHE_TTL, directory=cache.CACHE_DIR, maxfiles=4096)
+
+# Most days sent for a comparison, split between the selected states
+COMPARE_POINTS = int(os.environ.get('COMPARE_POINTS', 5000))
+
+# States the compare tab opens with
+COMPARE_DEFAULT = ['California', 'Florida', 'New York', 'Texas']
 
 ############
 # Dash App #
@@ -123,51 +59,60 @@ date = date.strftime('%m-%d-%Y')
 app = dash.Dash(__name__)
 
 # Layout
-app.layout = html.Div(children=[
+# (a function so the date updates when new data is swapped in)
+def serve_layout():
+
+    # Served before the data is loaded with LAZY_START, the tabs fill in once it is
+    date = dataset.current.date if dataset.ready() else 'loading'
 
-        # Header image and title
-        html.Header(
-            html.Div([ 
+    return html.Div(children=[
+
+            # Header image and title
+            html.Header(
+                html.Div([ 
             
-                html.Img(src=app.get_asset_url('c19.jpeg')),
+                    html.Img(src=app.get_asset_url('c19.jpeg')),
 
-                html.H1('Covid-19 Data'),
+                    html.H1('Covid-19 Data'),
 
-                ],className='head')
+                    ],className='head')
 
-            ),
+                ),
 
-        html.Br(),
+            html.Br(),
         
-        # Intro / Date / Links
-        html.P('Data on Covid-19 Case Numbers and Deaths for the United States. Search by State and find out more about your area.'),
+            # Intro / Date / Links
+            html.P('Data on Covid-19 Case Numbers and Deaths for the United States. Search by State and find out more about your area.'),
        
-        html.P('Data is currently valid from *{}*'.format(date)),
+            html.P('Data is currently valid from *{}*'.format(date)),
 
-        html.A('data source', href='https://github.com/nytimes/covid-19-data/'),
+            html.A('data source', href='https://github.com/nytimes/covid-19-data/'),
 
-        html.Br(),
+            html.Br(),
 
-        html.A('code source', href='https://github.com/chadless1/c19-stats-app/'),
+            html.A('code source', href='https://github.com/chadless1/c19-stats-app/'),
 
-        # Line break
-        html.Br(),
-        html.Hr(),
-        html.Br(),
+            # Line break
+            html.Br(),
+            html.Hr(),
+            html.Br(),
         
-        # Tabs
-        dcc.Tabs(id="tabs", value='tab-1', children=[
+            # Tabs
+            dcc.Tabs(id="tabs", value='tab-1', children=[
             
-            dcc.Tab(label='USA', value='tab-1'),
-            dcc.Tab(label='Data By State', value='tab-2'),
+                dcc.Tab(label='USA', value='tab-1'),
+                dcc.Tab(label='Data By State', value='tab-2'),
+                dcc.Tab(label='Compare States', value='tab-3'),
 
-            ], style={'width': '90%', 'margin': 'auto', 'box-shadow': '0 1px 3px rgba(0,0,0,0.12), 0 1px 2px rgba(0,0,0,0.24)'}, colors={'border': 'grey', 'background': '#082255', 'primary': 'black'}),
+                ], style={'width': '90%', 'margin': 'auto', 'box-shadow': '0 1px 3px rgba(0,0,0,0.12), 0 1px 2px rgba(0,0,0,0.24)'}, colors={'border': 'grey', 'background': '#082255', 'primary': 'black'}),
         
-        # Tab contnent
-        html.Div(id='tabs-content'),
+            # Tab contnent
+            html.Div(id='tabs-content'),
+
+            ]) # main div tag
+               # End of app layout
 
-        ]) # main div tag
-           # End of app layout
+app.layout = serve_layout
 
 ###########################################################
 #                     CallBacks                           #
@@ -178,34 +123,46 @@ app.layout = html.Div(children=[
               [Input('tabs', 'value')])
 
 def render_content(tab):
-    
-    # US Case and Death Calculations
-    today = df_states['date'].iloc[-1]
 
-    df_usa = df_states[df_states['date'] == today]
-    
-    usa_total_cases = df_usa['cases'].sum()
-    usa_total_deaths = df_usa['deaths'].sum()
+    # Only the three tabs, anything else would get its own cache entry
+    if tab not in ('tab-1', 'tab-2', 'tab-3'):
+        raise PreventUpdate
+
+    data = dataset.get()
+
+    # Tabs only change when the data does, build each one once per version
+    key = (data.version, tab)
 
-    usa_total_df = df_states[['cases','deaths']].groupby(df_states['date'])
-    usa_total_df = usa_total_df.sum()
+    with tab_lock:
+        if key not in tab_cache:
 
-    usa_last = usa_total_df.tail()
+            # Drop layouts from older versions
+            for old in [k for k in tab_cache if k[0] != data.version]:
+                tab_cache.pop(old, None)
 
-    # Calculate % Change in Cases and Death
-    usa_case_percent = (usa_total_df['cases'].iloc[-1] - usa_total_df['cases'].iloc[-5]) / usa_total_df['cases'].iloc[-5] * 100
-    usa_case_percent = round(usa_case_percent, 2)
+            tab_cache[key] = build_content(tab, data)
 
-    usa_death_percent = (usa_total_df['deaths'].iloc[-1] - usa_total_df['deaths'].iloc[-5]) / usa_total_df['deaths'].iloc[-5] * 100
-    usa_death_percent = round(usa_death_percent, 2)
+        return tab_cache[key]
+
+def build_content(tab, data):
+
+    usa_metrics = data.usa_metrics
     
-    # New df for graphs
-    dff = df_states.groupby('date')[['cases', 'deaths']].sum()
+    # US Case and Death Calculations
+    usa_total_cases = usa_metrics['cases_total']
+    usa_total_deaths = usa_metrics['deaths_total']
+
+    # % Change in Cases and Death
+    usa_case_percent = usa_metrics['cases_change_5']
+    usa_death_percent = usa_metrics['deaths_change_5']
     
-    dff = dff.diff()
-    dff = dff.fillna(0)
+    # Daily changes for graphs, the full history thinned out (see downsample.py)
+    dff = usa_metrics['graph']
+
+    dff_tail = usa_metrics['recent']
 
-    dff_tail = dff.tail() 
+    # Projected daily counts, dashed after the last day (see forecast.py)
+    projection = data.forecast['usa']
 
     # Tab 1
     if tab == 'tab-1':
@@ -242,7 +199,16 @@ def render_content(tab):
                 # Choropleth map
                 html.Div([
 
-                    dcc.Graph(figure=fig),
+                    dcc.RadioItems(id='map_view',
+                        options=[
+                            {'label': 'Cases', 'value': 'cases'},
+                            {'label': 'Per 100k', 'value': 'per-100k'},
+                         ],
+                        value='cases',
+                        labelStyle={'display': 'inline-block', 'padding': '5px 5px'}
+                                ),
+
+                    dcc.Graph(id='usa-map'),
 
                     ],className='twelve columns'),
 
@@ -280,8 +246,10 @@ def render_content(tab):
 
                             'data': [
                                 
-                                {'x': dff.index, 'y': dff['cases'].values, 'type': 'line', 'name': 'cases'},
-                                {'x': dff.index, 'y': dff['deaths'].values, 'type': 'line', 'name': 'deaths'},
+                                {'x': dff['date'], 'y': dff['cases'], 'type': 'line', 'name': 'cases', 'line': {'color': '#1f77b4'}},
+                                {'x': dff['date'], 'y': dff['deaths'], 'type': 'line', 'name': 'deaths', 'line': {'color': '#ff7f0e'}},
+                                {'x': projection['date'], 'y': projection['cases'], 'type': 'line', 'name': 'cases forecast', 'line': {'color': '#1f77b4', 'dash': 'dash'}},
+                                {'x': projection['date'], 'y': projection['deaths'], 'type': 'line', 'name': 'deaths forecast', 'line': {'color': '#ff7f0e', 'dash': 'dash'}},
 
                                 ],
 
@@ -306,7 +274,7 @@ def render_content(tab):
 
                             'data': [
                                 
-                                {'x': dff_tail.index, 'y': dff_tail['cases'].values, 'type': 'bar', 'name': 'cases'},
+                                {'x': dff_tail['date'], 'y': dff_tail['cases'], 'type': 'bar', 'name': 'cases'},
 
                                 ],
 
@@ -331,7 +299,7 @@ def render_content(tab):
 
                             'data': [
                                 
-                                {'x': dff_tail.index, 'y': dff_tail['deaths'].values, 'type': 'bar', 'name': 'deaths', 'marker': {'color': 'orange'}},
+                                {'x': dff_tail['date'], 'y': dff_tail['deaths'], 'type': 'bar', 'name': 'deaths', 'marker': {'color': 'orange'}},
 
                                 ],
 
@@ -367,7 +335,7 @@ def render_content(tab):
             html.Div([
             dcc.Dropdown(id='my-dropdown2',
                 
-                options=[{'label': i, 'value': i} for i in sorted(df_states['state'].unique())],
+                options=[{'label': i, 'value': i} for i in data.state_metrics['states']],
                 #multi=True,
                 value='Massachusetts',
                 searchable=False,
@@ -392,6 +360,11 @@ def render_content(tab):
 
                     ],className='row', style={'text-align': 'left', 'margin-left': '90px'}),
             
+            # Daily series for the selected state, and the days
+            # graph_1 is zoomed into at full resolution
+            dcc.Store(id='state-series'),
+            dcc.Store(id='state-zoom'),
+
             # Main Content Div    
 
             html.Div([
@@ -418,154 +391,275 @@ def render_content(tab):
                     ],className='twelve columns'),
                 
                 ],className='container'),
+
+            html.Br(),
+
+            # County drill down
+            html.H3('Select County'),
+
+            html.Div([
+            dcc.Dropdown(id='county-dropdown',
+                searchable=False,
+            
+                ),
+            ], style={'margin': 'auto', 'width': '50%', 'text-align': 'center', 'color': 'black'}),
+
+            html.P('No county data loaded (python data_store.py --counties)') if not counties.available() else html.Br(),
+
+            # Daily series for the selected county
+            dcc.Store(id='county-series'),
+
+            html.Div([
+
+                # county graph div
+                html.Div([
+
+                    dcc.Graph(id='county-graph')
+
+                    ],className='six columns'),
+
+                # county data div
+                html.Div([
+
+                    html.Div(id='county-table'),
+
+                    ],className='six columns'),
+
+                ],className='container'),
         ])# end of Tab 2
 
+    elif tab == 'tab-3':
+        return html.Div([
+
+           # Tab 3 Content #
+           #################
+
+            html.H3('Compare States'),
+
+            html.Div([
+            dcc.Dropdown(id='compare-dropdown',
+
+                options=[{'label': i, 'value': i} for i in data.state_metrics['states']],
+                multi=True,
+                value=[i for i in COMPARE_DEFAULT if i in data.table],
+
+                ),
+            ], style={'margin': 'auto', 'width': '50%', 'text-align': 'center', 'color': 'black'}),
+
+            html.Br(),
+
+            # Radio Button Graph
+            html.Div([
+
+                    dcc.RadioItems(id='compare-button',
+                        options=[
+                            {'label': 'Cases', 'value': 'CASES'},
+                            {'label': 'Deaths', 'value': 'DEATH'},
+                         ],
+                        value='CASES',
+                        labelStyle={'display': 'inline-block', 'margin-bottom': '10px', 'padding': '5px 5px'}
+                                )
+
+                    ],className='row', style={'text-align': 'left', 'margin-left': '90px'}),
+
+            # Daily series for the selected states
+            dcc.Store(id='compare-series'),
+
+            html.Div([
+
+                # graph div
+                html.Div([
+
+                    dcc.Graph(id='compare-graph')
+
+                    ],className='twelve columns'),
+
+                # table div
+                html.Div([
+
+                    html.Div(id='compare-table'),
+
+                    ],className='twelve columns'),
+
+                ],className='container'),
+        ])# end of Tab 3
+
     ##########################################################
+# USA Map Callback
+# (figures are built once per data version, see maps.py)
+
+@app.callback(Output('usa-map', 'figure'),
+        [Input('map_view', 'value')])
+
+def update_map(view):
+
+    figures = dataset.get().maps
+
+    if view not in figures:
+        raise PreventUpdate
+
+    return figures[view]
+
+##########################################################
 # State Graphs Callback and Functions
-# Case Graph
+# (only the series is sent, the graphs are drawn in the browser
+# by assets/graphs.js so the radio buttons don't hit the server)
 
-@app.callback(Output('graph_1', 'figure'),
-        [Input('my-dropdown2', 'value'), Input('r_button', 'value')])
+@app.callback([Output('state-series', 'data'), Output('total_cases', 'children')],
+        [Input('my-dropdown2', 'value')])
 
-def update_figure(value, button):
+def update_state(value):
 
-    if button == 'BOTH':
+    # One request per state change, both outputs come from the same version
+    data = dataset.get()
 
-        df3 = df_states[df_states['state'] == value]
-        
-        df3 = df3.set_index('date')
-        
-        df4 = df3['cases'].diff()
-        df5 = df3['deaths'].diff()
+    if value not in data.table:
+        raise PreventUpdate
 
-        df4 = df4.mask(df4 < 0)
-        df5 = df5.mask(df5 < 0)
+    state_metrics = data.state_metrics
 
-        figure={
-                
-                'data': [
-                    
-                    {'x': df4.index, 'y': df4, 'type': 'line', 'name': 'cases'},
-                    {'x': df5.index, 'y': df5, 'type': 'line', 'name': 'deaths'},
+    # graph_1 draws the projection as a dashed line (see forecast.py)
+    series = dict(state_metrics['series'][value], forecast=data.forecast['states'][value])
 
-                    ],
-                 'layout': {
-                    'title': 'Cases & Deaths',
-                    'height': 310,
-                    'paper_bgcolor': '#082255',
-                    'plot_bgcolor': '#082255',
-                    'font': {'color': 'white'},
-                }}
+    return series, update_contetnt(state_metrics['summary'][value], data.analytics['summary'][value])
 
-        return(figure)
+# Zoomed in graph_1
+# (state-series is thinned out, fetch every day in the visible range)
 
-    elif button == 'CASES':
+@app.callback(Output('state-zoom', 'data'),
+        [Input('graph_1', 'relayoutData')], [State('my-dropdown2', 'value')])
 
-        df3 = df_states[df_states['state'] == value]
-        
-        df3 = df3.set_index('date')
-        
-        df4 = df3['cases'].diff()
-        df5 = df3['deaths'].diff()
+def update_state_zoom(relayout, value):
 
-        df4 = df4.mask(df4 < 0)
-        df5 = df5.mask(df5 < 0)
+    data = dataset.get()
 
-        figure={
-                
-                'data': [
-                    
-                    {'x': df4.index, 'y': df4, 'type': 'line', 'name': 'cases'},
-
-                    ],
-                 'layout': {
-                    'title': 'Cases',
-                    'paper_bgcolor': '#082255',
-                    'plot_bgcolor': '#082255',
-                    'font': {'color': 'white'},
-                }}
-
-        return(figure)
-    
-    elif button == 'DEATH':
+    if not relayout or value not in data.table:
+        raise PreventUpdate
 
-        df3 = df_states[df_states['state'] == value]
-        
-        df3 = df3.set_index('date')
-        
-        df4 = df3['cases'].diff()
-        df5 = df3['deaths'].diff()
+    # Zoomed back out
+    if relayout.get('xaxis.autorange'):
+        return None
 
-        df4 = df4.mask(df4 < 0)
-        df5 = df5.mask(df5 < 0)
+    if 'xaxis.range[0]' in relayout:
+        start, end = relayout['xaxis.range[0]'], relayout['xaxis.range[1]']
+    elif 'xaxis.range' in relayout and len(relayout['xaxis.range']) == 2:
+        start, end = relayout['xaxis.range']
+    else:
+        raise PreventUpdate
 
-        figure={
-                
-                'data': [
-                    
-                    {'x': df5.index, 'y': df5, 'type': 'line', 'name': 'deaths', 'marker': {'color': 'orange'}},
+    import metrics
 
-                    ],
-                 'layout': {
-                    'title': 'Deaths',
-                    'paper_bgcolor': '#082255',
-                    'plot_bgcolor': '#082255',
-                    'font': {'color': 'white'},
-                }}
+    # (a range that isn't two dates is ignored)
+    try:
+        return metrics.zoom_series(data.table, value, start, end)
+    except (TypeError, ValueError):
+        raise PreventUpdate
 
-        return(figure)
+# County Callbacks
+# (county data is loaded per state on first use, see counties.py)
 
-@app.callback(Output('total_cases', 'children'),
+@app.callback([Output('county-dropdown', 'options'), Output('county-dropdown', 'value')],
         [Input('my-dropdown2', 'value')])
 
-def update_contetnt(value):
+def update_county_options(value):
 
-    # New DataFrame
-    dff = df_states[df_states['state'] == value]
+    # Cleared dropdown, or anything that isn't a state (the name ends up in a path)
+    if value not in dataset.get().table:
+        raise PreventUpdate
 
-    # Case and Death Totals
-    t_cases = dff['cases'].iloc[-1]
-    t_deaths = dff['deaths'].iloc[-1]
+    county_data = counties.get(value)
 
-    # Case Calculations
-    dff2 = dff.set_index('date')
-    dff2 = dff2['cases'].diff()
-    dff2 = dff2.dropna()
+    if county_data is None:
+        return [], None
 
-    average_cases = dff2.mean()
-    average_cases = round(average_cases)
+    names = county_data[0].states()
 
-    case_percent = (dff['cases'].iloc[-1] - dff['cases'].iloc[-5]) / dff['cases'].iloc[-5] * 100
-    case_percent = round(case_percent, 2)
-  
-    month_cases = (dff['cases'].iloc[-1] - dff['cases'].iloc[-30]) / dff['cases'].iloc[-30] * 100
-    month_cases = round(month_cases, 2)
+    return [{'label': i, 'value': i} for i in names], names[0]
 
-    average_5_cases = dff2.tail()
-    average_5_cases = round(average_5_cases.mean())
+@app.callback([Output('county-series', 'data'), Output('county-table', 'children')],
+        [Input('county-dropdown', 'value')], [State('my-dropdown2', 'value')])
 
-    average_30_cases = dff2.tail(30)
-    average_30_cases = round(average_30_cases.mean())
+def update_county(county, value):
 
-    # Death Calculations
-    dff3 = dff.set_index('date')
-    dff3 = dff3['deaths'].diff()
-    dff3 = dff3.dropna()
+    if value not in dataset.get().table:
+        raise PreventUpdate
 
-    average_deaths = dff3.mean()
-    average_deaths = round(average_deaths)
+    county_data = counties.get(value)
 
-    death_percent = (dff['deaths'].iloc[-1] - dff['deaths'].iloc[-5]) / dff['deaths'].iloc[-5] * 100
-    death_percent = round(death_percent, 2)
-    
-    month_deaths = (dff['deaths'].iloc[-1] - dff['deaths'].iloc[-30]) / dff['deaths'].iloc[-30] * 100
-    month_deaths = round(month_deaths, 2)
+    if county_data is None or county not in county_data[0]:
+        raise PreventUpdate
+
+    table, county_metrics, county_analytics = county_data
+
+    return county_metrics['series'][county], update_contetnt(county_metrics['summary'][county], county_analytics['summary'][county])
+
+# County Graph
+app.clientside_callback(
+        ClientsideFunction(namespace='graphs', function_name='daily'),
+        Output('county-graph', 'figure'),
+        [Input('county-series', 'data'), Input('r_button', 'value')])
+
+# Case Graph
+app.clientside_callback(
+        ClientsideFunction(namespace='graphs', function_name='daily'),
+        Output('graph_1', 'figure'),
+        [Input('state-series', 'data'), Input('r_button', 'value'), Input('state-zoom', 'data')])
+
+# Graph 2
+app.clientside_callback(
+        ClientsideFunction(namespace='graphs', function_name='recent'),
+        Output('graph_2', 'figure'),
+        [Input('state-series', 'data'), Input('r_button', 'value')])
+
+# Compare Callback
+# (all the selected states come from one batched query and are thinned out
+# to COMPARE_POINTS days in total, the graph is drawn in the browser)
 
-    average_5_deaths = dff3.tail()
-    average_5_deaths = round(average_5_deaths.mean())
+@app.callback([Output('compare-series', 'data'), Output('compare-table', 'children')],
+        [Input('compare-dropdown', 'value')])
 
-    average_30_deaths = dff3.tail(30)
-    average_30_deaths = round(average_30_deaths.mean())
+def update_compare(values):
+
+    import metrics
+
+    data = dataset.get()
+
+    names = [i for i in values or [] if i in data.table]
+
+    if not names:
+        return [], html.P('Select states to compare')
+
+    points = max(COMPARE_POINTS // len(names), 30)
+
+    return metrics.compare_series(data.table, names, points), compare_table(names, data.state_metrics['summary'], data.analytics['summary'])
+
+# Compare Graph
+app.clientside_callback(
+        ClientsideFunction(namespace='graphs', function_name='compare'),
+        Output('compare-graph', 'figure'),
+        [Input('compare-series', 'data'), Input('compare-button', 'value')])
+
+# Stats table for a state's precomputed numbers
+# (trends are the rolling numbers from analytics.py)
+def update_contetnt(stats, trends=None):
+
+    # Case and Death Totals
+    t_cases = stats['cases_total']
+    t_deaths = stats['deaths_total']
+
+    # Case Calculations
+    average_cases = stats['cases_average']
+    case_percent = stats['cases_change_5']
+    month_cases = stats['cases_change_30']
+    average_5_cases = stats['cases_average_5']
+    average_30_cases = stats['cases_average_30']
+
+    # Death Calculations
+    average_deaths = stats['deaths_average']
+    death_percent = stats['deaths_change_5']
+    month_deaths = stats['deaths_change_30']
+    average_5_deaths = stats['deaths_average_5']
+    average_30_deaths = stats['deaths_average_30']
 
     return(
             # HTML TABLE
@@ -589,24 +683,24 @@ def update_contetnt(value):
                 html.Tr([
                     #Average per day
                     html.Td('Daily Average:'),
-                    html.Td('{:,}'.format(average_cases)),
-                    html.Td('{:,}'.format(average_deaths)),
+                    html.Td('{:,.0f}'.format(average_cases)),
+                    html.Td('{:,.0f}'.format(average_deaths)),
 
                 ] ),
 
                 html.Tr([
                     # Average 5 Days
                     html.Td('Average Last 5 Days:'),
-                    html.Td('{:,}'.format(average_5_cases)),
-                    html.Td('{:,}'.format(average_5_deaths)),
+                    html.Td('{:,.0f}'.format(average_5_cases)),
+                    html.Td('{:,.0f}'.format(average_5_deaths)),
 
                 ] ),
                 
                 html.Tr([
                     # Average 30 Days
                     html.Td('Average Last 30 Days:'),
-                    html.Td('{:,}'.format(average_30_cases)),
-                    html.Td('{:,}'.format(average_30_deaths)),
+                    html.Td('{:,.0f}'.format(average_30_cases)),
+                    html.Td('{:,.0f}'.format(average_30_deaths)),
 
                 ] ),
 
@@ -625,127 +719,148 @@ def update_contetnt(value):
 
                 ] ),
 
-                ] ),
+                ] + trend_rows(trends)),
             )
 
-# Graph 2
+def trend_rows(trends):
+
+    if trends is None:
+        return []
+
+    rows = [
+        ('7 Day Average:', 'average_7', '{:,.0f}'),
+        ('14 Day Average:', 'average_14', '{:,.0f}'),
+        ('Week over Week:', 'week_growth', '{:,}%'),
+        ('Doubling Time (days):', 'doubling', '{:,}'),
+        ('Per 100k:', 'per_100k', '{:,}'),
+        ('7 Day Average per 100k:', 'average_7_per_100k', '{:,}'),
+        ]
+
+    def cell(value, spec):
+        # nan when there aren't enough days, inf when nothing is growing
+        return html.Td(spec.format(value) if math.isfinite(value) else '-')
+
+    return [
+        html.Tr([
+            html.Td(label),
+            cell(trends['cases_' + key], spec),
+            cell(trends['deaths_' + key], spec),
+        ])
+        for label, key, spec in rows if 'cases_' + key in trends
+        ]
+
+# One row per state with the numbers update_contetnt shows
+def compare_table(names, summary, trends):
+
+    columns = [
+        ('Cases', 'cases_total', '{:,}'),
+        ('Deaths', 'deaths_total', '{:,}'),
+        ('Cases Avg 5 Days', 'cases_average_5', '{:,.0f}'),
+        ('Deaths Avg 5 Days', 'deaths_average_5', '{:,.0f}'),
+        ('Cases Avg 30 Days', 'cases_average_30', '{:,.0f}'),
+        ('Deaths Avg 30 Days', 'deaths_average_30', '{:,.0f}'),
+        ('Cases % 5 Days', 'cases_change_5', '{:,}%'),
+        ('Deaths % 5 Days', 'deaths_change_5', '{:,}%'),
+        ('Cases % 30 Days', 'cases_change_30', '{:,}%'),
+        ('Deaths % 30 Days', 'deaths_change_30', '{:,}%'),
+        ('Cases Week over Week', 'cases_week_growth', '{:,}%'),
+        ('Cases Avg 7 Days per 100k', 'cases_average_7_per_100k', '{:,}'),
+        ]
+
+    def cell(value, spec):
+        return html.Td(spec.format(value) if math.isfinite(value) else '-')
+
+    def value(name, key):
+        return summary[name][key] if key in summary[name] else trends[name].get(key, math.nan)
+
+    return html.Table([
+        html.Tr([html.Th('State')] + [html.Th(label) for label, key, spec in columns]),
+        ] + [
+        html.Tr([html.Td(name)] + [cell(value(name, key), spec) for label, key, spec in columns])
+        for name in names
+        ])
 
-@app.callback(Output('graph_2', 'figure'),
-        [Input('my-dropdown2', 'value'), Input('r_button', 'value')])
+########################################################
 
+app.config.suppress_callback_exceptions=True
 
-def update_figure(value, button):
+server = app.server
 
+# Figure Cache
+# (dash's id for the multi output state callback)
+STATE_OUTPUTS = '..state-series.data...total_cases.children..'
+COUNTY_OPTIONS = '..county-dropdown.options...county-dropdown.value..'
+COUNTY_OUTPUTS = '..county-series.data...county-table.children..'
+COMPARE_OUTPUTS = '..compare-series.data...compare-table.children..'
 
-    if button == 'BOTH':
+def prewarm_figures(data):
 
-        df3 = df_states[df_states['state'] == value]
-        
-        df3 = df3.set_index('date')
-        
-        df4 = df3['cases'].diff()
-        df5 = df3['deaths'].diff()
+    figure_cache.drop_old(data.version)
 
-        df4 = df4.mask(df4 < 0)
-        df5 = df5.mask(df5 < 0)
+    bodies = []
 
-        df4 = df4.tail()
-        df5 = df5.tail()
+    for state in data.state_metrics['states']:
+        bodies.append(cache.callback_body(STATE_OUTPUTS, [('my-dropdown2', 'value', state)]))
 
-        figure={
-                
-                'data': [
-                    
-                    {'x': df4.index, 'y': df4, 'type': 'bar', 'name': 'cases'},
-                    {'x': df5.index, 'y': df5, 'type': 'bar', 'name': 'deaths'},
-
-                    ],
-                 'layout': {
-                    'title': 'Last 5 Days',
-                    'height': '300',
-                    'xaxis': {'tickformat': '%b %d, %Y'},
-                    'xaxis': {'maxnumberoflabels': '5'},
-                    'paper_bgcolor': '#082255',
-                    'plot_bgcolor': '#082255',
-                    'font': {'color': 'white'} 
-                        
-                }}
-
-        return(figure)
-
-    elif button == 'CASES':
-
-        df3 = df_states[df_states['state'] == value]
-        
-        df3 = df3.set_index('date')
-        
-        df4 = df3['cases'].diff()
-        df5 = df3['deaths'].diff()
+    for view in maps.VIEWS:
+        bodies.append(cache.callback_body('usa-map.figure', [('map_view', 'value', view)]))
 
-        df4 = df4.mask(df4 < 0)
-        df5 = df5.mask(df5 < 0)
+    for tab in ['tab-1', 'tab-2', 'tab-3']:
+        bodies.append(cache.callback_body('tabs-content.children', [('tabs', 'value', tab)]))
 
-        df4 = df4.tail()
-    
-        figure={
-                
-                'data': [
-                    
-                    {'x': df4.index, 'y': df4, 'type': 'bar', 'name': 'cases'},
-                    {'x': df4.index, 'y': df4, 'type': 'line', 'marker': {'color': 'black'}},
-
-                    ],
-                 'layout': {
-                    'title': 'Cases Last 5 Days', 
-                    'xaxis': {'tickformat': '%b %d, %Y'},
-                    'xaxis': {'maxnumberoflabels': '5'},
-                    'paper_bgcolor': '#082255',
-                    'plot_bgcolor': '#082255',
-                    'font': {'color': 'white'} 
-                }}
-
-
-        return(figure)
-    
-    elif button == 'DEATH':
+    cache.prewarm(server, bodies)
 
-        df3 = df_states[df_states['state'] == value]
-        
-        df3 = df3.set_index('date')
-        
-        df4 = df3['cases'].diff()
-        df5 = df3['deaths'].diff()
+# Encode callback responses with orjson when it's installed (see transport.py)
+transport.install(app)
 
-        df4 = df4.mask(df4 < 0)
-        df5 = df5.mask(df5 < 0)
+# Callback latency and sizes at /metrics (see instrument.py),
+# installed first so cached responses are timed as well
+instrument.install(app, prewarm_header=cache.PREWARM_HEADER)
 
-        df5 = df5.tail()
+instrument.gauges['c19_cache_requests'] = ('Response cache lookups', lambda: {
+    'result="hit"': figure_cache.hits,
+    'result="miss"': figure_cache.misses,
+    })
+instrument.gauges['c19_data_info'] = ('Loaded data version', lambda: {
+    'version="{}"'.format(dataset.current.version): 1,
+    } if dataset.ready() else {})
 
-        figure={
-                
-                'data': [
-                    
-                    {'x': df5.index, 'y': df5, 'type': 'bar', 'name': 'deaths', 'marker': {'color': 'orange'}},
-                    {'x': df5.index, 'y': df5, 'type': 'line', 'marker': {'color': 'black'}},
-
-                    ],
-                 'layout': {
-                    'title': 'Deaths Last 5 Days', 
-                    'xaxis': {'tickformat': '%b %d, %Y'},
-                    'xaxis': {'maxnumberoflabels': '5'},
-                    'paper_bgcolor': '#082255',
-                    'plot_bgcolor': '#082255',
-                    'font': {'color': 'white'} 
-                
-                }}
+# Health checks, /ready answers 503 until the data is loaded
+@server.route('/health')
+def health():
 
-        return(figure)
+    return 'ok'
 
-########################################################
+@server.route('/ready')
+def ready():
 
-app.config.suppress_callback_exceptions=True
+    data = dataset.current
 
-server = app.server
+    if data is None:
+        return flask.jsonify(ready=False), 503
+
+    return flask.jsonify(ready=True, version=data.version, date=data.date)
+
+# Map json for embedding, /map/cases.json and /map/per-100k.json
+maps.install(server, dataset.get)
+
+# csv and ndjson data endpoints under /api (see api.py)
+api.install(server, dataset.get)
+
+if FIGURE_CACHE:
+    # (not the county outputs, the county store changes without the state
+    # data version changing, see counties.py)
+    cache.install(server, figure_cache, [STATE_OUTPUTS, COMPARE_OUTPUTS, 'usa-map.figure', 'tabs-content.children'], lambda: dataset.get().version, memory_only=[COMPARE_OUTPUTS])
+    dataset.listeners.append(prewarm_figures)
+
+# Refresh the data in the background
+dataset.start_refresher()
+
+startup_seconds = time.perf_counter() - started
+
+instrument.gauges['c19_startup_seconds'] = ('Seconds to import the app', lambda: {
+    '': round(startup_seconds, 6),
+    })
 
 if __name__ == '__main__':
     app.run_server(debug=True)
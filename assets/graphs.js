@@ -0,0 +1,134 @@
+/* State graphs
+   Drawn in the browser from the state's daily series (the state-series
+   store) so switching between cases, deaths and both needs no request
+–––––––––––––––––––––––––––––––––––––––––––––––––– */
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+
+    graphs: {
+
+        // Cases & Deaths, full history (thinned out by the server, with
+        // every day in the zoomed range spliced in when there is one)
+        daily: function(series, button, zoom) {
+
+            if (!series) {
+                return window.dash_clientside.no_update;
+            }
+
+            if (zoom && zoom.name == series.name && zoom.date.length) {
+                var first = zoom.date[0];
+                var last = zoom.date[zoom.date.length - 1];
+
+                var lo = 0;
+                while (lo < series.date.length && series.date[lo] < first) { lo++; }
+
+                var hi = lo;
+                while (hi < series.date.length && series.date[hi] <= last) { hi++; }
+
+                series = {
+                    'name': series.name,
+                    'date': series.date.slice(0, lo).concat(zoom.date, series.date.slice(hi)),
+                    'cases': series.cases.slice(0, lo).concat(zoom.cases, series.cases.slice(hi)),
+                    'deaths': series.deaths.slice(0, lo).concat(zoom.deaths, series.deaths.slice(hi)),
+                    'forecast': series.forecast,
+                };
+            }
+
+            var layout = {
+                // keeps the zoom when the figure is redrawn for the same state
+                'uirevision': series.name,
+                'paper_bgcolor': '#082255',
+                'plot_bgcolor': '#082255',
+                'font': {'color': 'white'},
+            };
+
+            var cases = [{'x': series.date, 'y': series.cases, 'type': 'line', 'name': 'cases', 'line': {'color': '#1f77b4'}}];
+            var deaths = [{'x': series.date, 'y': series.deaths, 'type': 'line', 'name': 'deaths', 'line': {'color': '#ff7f0e'}}];
+
+            // The projection from the last day on, dashed (states only)
+            var forecast = series.forecast;
+
+            if (forecast) {
+                cases.push({'x': forecast.date, 'y': forecast.cases, 'type': 'line', 'name': 'cases forecast', 'line': {'color': '#1f77b4', 'dash': 'dash'}});
+                deaths.push({'x': forecast.date, 'y': forecast.deaths, 'type': 'line', 'name': 'deaths forecast', 'line': {'color': '#ff7f0e', 'dash': 'dash'}});
+            }
+
+            if (button == 'CASES') {
+                layout.title = 'Cases';
+                return {'data': cases, 'layout': layout};
+            }
+
+            if (button == 'DEATH') {
+                layout.title = 'Deaths';
+                return {'data': deaths, 'layout': layout};
+            }
+
+            layout.title = 'Cases & Deaths';
+            layout.height = 310;
+            return {'data': cases.concat(deaths), 'layout': layout};
+        },
+
+        // Bars for the last 5 days
+        recent: function(series, button) {
+
+            if (!series) {
+                return window.dash_clientside.no_update;
+            }
+
+            var x = series.date.slice(-5);
+            var cases = series.cases.slice(-5);
+            var deaths = series.deaths.slice(-5);
+
+            var layout = {
+                'xaxis': {'maxnumberoflabels': '5'},
+                'paper_bgcolor': '#082255',
+                'plot_bgcolor': '#082255',
+                'font': {'color': 'white'},
+            };
+
+            if (button == 'CASES') {
+                layout.title = 'Cases Last 5 Days';
+                return {'data': [
+                    {'x': x, 'y': cases, 'type': 'bar', 'name': 'cases'},
+                    {'x': x, 'y': cases, 'type': 'line', 'marker': {'color': 'black'}},
+                ], 'layout': layout};
+            }
+
+            if (button == 'DEATH') {
+                layout.title = 'Deaths Last 5 Days';
+                return {'data': [
+                    {'x': x, 'y': deaths, 'type': 'bar', 'name': 'deaths', 'marker': {'color': 'orange'}},
+                    {'x': x, 'y': deaths, 'type': 'line', 'marker': {'color': 'black'}},
+                ], 'layout': layout};
+            }
+
+            layout.title = 'Last 5 Days';
+            layout.height = '300';
+            return {'data': [
+                {'x': x, 'y': cases, 'type': 'bar', 'name': 'cases'},
+                {'x': x, 'y': deaths, 'type': 'bar', 'name': 'deaths'},
+            ], 'layout': layout};
+        },
+
+        // One line per state for the compare tab
+        compare: function(series, button) {
+
+            if (!series) {
+                return window.dash_clientside.no_update;
+            }
+
+            var column = button == 'DEATH' ? 'deaths' : 'cases';
+
+            var data = series.map(function(s) {
+                return {'x': s.date, 'y': s[column], 'type': 'line', 'name': s.name};
+            });
+
+            return {'data': data, 'layout': {
+                'title': button == 'DEATH' ? 'Daily Deaths' : 'Daily Cases',
+                'paper_bgcolor': '#082255',
+                'plot_bgcolor': '#082255',
+                'font': {'color': 'white'},
+            }};
+        },
+    }
+});
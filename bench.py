@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+#
+#############
+# Benchmark #
+#############
+#
+# Description: Times the data load and the dash callbacks offline against the
+# snapshots in data/, then again on synthetic data with more days and more
+# regions to show how each path grows with history. Results are written as
+# json so runs from different commits can be compared
+#
+# Usage: python bench.py [-o results.json] [--compare old.json] [--quick]
+#
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import platform
+import statistics
+import subprocess
+
+# No background refresh or prewarm while timing, and time the callbacks
+# themselves rather than the response cache
+os.environ['REFRESH_INTERVAL'] = '0'
+os.environ.setdefault('FIGURE_CACHE', '0')
+
+import numpy as np
+import pandas as pd
+import plotly
+
+import data_store
+import dataset
+import metrics
+
+#################
+# Timing        #
+#################
+
+def timed(fn, repeat=5):
+
+    times = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+
+    return times, result
+
+
+def summarize(times, sizes=None):
+
+    times = sorted(times)
+
+    out = {
+        'n': len(times),
+        'mean_ms': round(statistics.mean(times), 3),
+        'p50_ms': round(times[len(times) // 2], 3),
+        'p95_ms': round(times[min(len(times) - 1, int(len(times) * 0.95))], 3),
+        'max_ms': round(times[-1], 3),
+    }
+
+    if sizes:
+        out['mean_bytes'] = int(statistics.mean(sizes))
+        out['max_bytes'] = max(sizes)
+
+    return out
+
+#################
+# Data loading  #
+#################
+
+def bench_load(repeat):
+
+    results = {}
+
+    snapshot = data_store.latest_snapshot()
+
+    times, df = timed(lambda: data_store.read_csv(snapshot), repeat)
+    results['load.csv_parse'] = summarize(times)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'states.feather')
+
+        times, _ = timed(lambda: data_store.write_store(df, path), repeat)
+        results['load.store_write'] = summarize(times)
+
+        times, _ = timed(lambda: data_store.read_store(path), repeat)
+        results['load.store_read'] = summarize(times)
+
+    times, arrays = timed(lambda: metrics.state_arrays(df), repeat)
+    results['load.state_arrays'] = summarize(times)
+
+    # The same data rebuilt from the history store (see history.py)
+    import history
+
+    if history.history_files():
+        def as_of():
+            history.as_of.cache_clear()
+            return history.as_of()
+
+        times, _ = timed(as_of, repeat)
+        results['load.history_as_of'] = summarize(times)
+
+    times, data = timed(lambda: dataset.build(arrays=arrays), repeat)
+    results['load.dataset_build'] = summarize(times)
+
+    # Projections for every state, part of the build (see forecast.py)
+    import forecast
+
+    times, _ = timed(lambda: forecast.build_forecast(data.table, data.usa_metrics['daily']), repeat)
+    results['load.forecast'] = summarize(times)
+
+    return results
+
+def bench_startup(repeat):
+
+    # Importing the app in a fresh interpreter, as a worker boots
+    results = {}
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    for lazy in ['0', '1']:
+        env = dict(os.environ, LAZY_START=lazy)
+        times, _ = timed(lambda: subprocess.check_call([sys.executable, '-c', 'import app'], cwd=here, env=env), repeat)
+        results['startup.import_app.lazy_{}'.format(lazy)] = summarize(times)
+
+    return results
+
+#################
+# Callbacks     #
+#################
+
+def post(client, output, inputs, state=None):
+
+    import cache
+
+    body = cache.callback_body(output, inputs)
+
+    if state:
+        body['state'] = [{'id': i, 'property': p, 'value': v} for i, p, v in state]
+
+    start = time.perf_counter()
+    r = client.post('/_dash-update-component', data=json.dumps(body), content_type='application/json')
+    elapsed = (time.perf_counter() - start) * 1000
+
+    if r.status_code not in (200, 204):
+        raise RuntimeError('{} returned {}'.format(output, r.status_code))
+
+    return elapsed, len(r.data)
+
+
+def bench_callbacks(app, prefix, repeat, states=None):
+
+    results = {}
+    client = app.server.test_client()
+    data = dataset.get()
+
+    # Tabs, cold (cache cleared every time) and warm
+    for tab in ['tab-1', 'tab-2']:
+        cold, warm, sizes = [], [], []
+
+        for _ in range(repeat):
+            app.tab_cache.clear()
+            t, size = post(client, 'tabs-content.children', [('tabs', 'value', tab)])
+            cold.append(t)
+            sizes.append(size)
+
+            t, size = post(client, 'tabs-content.children', [('tabs', 'value', tab)])
+            warm.append(t)
+
+        results['{}.render_content.{}.cold'.format(prefix, tab)] = summarize(cold, sizes)
+        results['{}.render_content.{}.warm'.format(prefix, tab)] = summarize(warm, sizes)
+
+    # State tab, every state
+    names = states or data.state_metrics['states']
+    times, sizes = [], []
+
+    for _ in range(repeat):
+        for name in names:
+            t, size = post(client, app.STATE_OUTPUTS, [('my-dropdown2', 'value', name)])
+            times.append(t)
+            sizes.append(size)
+
+    results['{}.update_state'.format(prefix)] = summarize(times, sizes)
+
+    # Comparing 5 states and every state
+    for label, selection in [('5', names[:5]), ('all', names)]:
+        times, sizes = [], []
+
+        for _ in range(repeat):
+            t, size = post(client, app.COMPARE_OUTPUTS, [('compare-dropdown', 'value', list(selection))])
+            times.append(t)
+            sizes.append(size)
+
+        results['{}.update_compare.{}'.format(prefix, label)] = summarize(times, sizes)
+
+    # update_contetnt on its own, no http
+    times = []
+
+    for name in names:
+        t, _ = timed(lambda: app.update_contetnt(data.state_metrics['summary'][name], data.analytics['summary'][name]), repeat)
+        times += t
+
+    results['{}.update_contetnt'.format(prefix)] = summarize(times)
+
+    # Serializing the state series the way dash does
+    times, sizes = [], []
+
+    for name in names:
+        series = data.state_metrics['series'][name]
+        t, out = timed(lambda: json.dumps(series, cls=plotly.utils.PlotlyJSONEncoder), repeat)
+        times += t
+        sizes.append(len(out))
+
+    results['{}.serialize_series'.format(prefix)] = summarize(times, sizes)
+
+    # Map views
+    times, sizes = [], []
+
+    for _ in range(repeat):
+        for view in data.maps:
+            t, size = post(client, 'usa-map.figure', [('map_view', 'value', view)])
+            times.append(t)
+            sizes.append(size)
+
+    results['{}.update_map'.format(prefix)] = summarize(times, sizes)
+
+    return results
+
+#################
+# Synthetic     #
+#################
+
+def synthetic_states(days, regions, seed=0):
+
+    # Cumulative counts that grow a little every day, with the odd correction
+    rng = np.random.RandomState(seed)
+
+    dates = pd.date_range('2020-01-21', periods=days, freq='D')
+
+    new_cases = rng.poisson(rng.uniform(10, 5000, size=(regions, 1)), size=(regions, days))
+    new_deaths = rng.poisson(new_cases * 0.02)
+
+    new_cases[rng.rand(regions, days) < 0.01] *= -1
+
+    cases = np.maximum(np.cumsum(new_cases, axis=1), 0)
+    deaths = np.maximum(np.cumsum(new_deaths, axis=1), 0)
+
+    names = ['Region {:04d}'.format(i) for i in range(regions)]
+
+    return pd.DataFrame({
+        'date': np.tile(dates.values, regions),
+        'state': pd.Categorical(np.repeat(names, days)),
+        'fips': np.repeat(np.arange(regions, dtype='int32'), days),
+        'cases': cases.ravel().astype('int64'),
+        'deaths': deaths.ravel().astype('int64'),
+    })
+
+
+def bench_scaling(app, scales, repeat):
+
+    results = {}
+
+    for days, regions in scales:
+        prefix = 'synthetic.{}d_{}r'.format(days, regions)
+
+        df = synthetic_states(days, regions)
+
+        times, arrays = timed(lambda: metrics.state_arrays(df), repeat)
+        results[prefix + '.state_arrays'] = summarize(times)
+
+        times, data = timed(lambda: dataset.build(arrays=arrays), repeat)
+        results[prefix + '.dataset_build'] = summarize(times)
+
+        # Swap the synthetic data in and time the callbacks on a sample of regions
+        dataset.current = data
+        app.tab_cache.clear()
+
+        sample = data.state_metrics['states'][::max(1, regions // 20)]
+        results.update(bench_callbacks(app, prefix, repeat, states=sample))
+
+    return results
+
+#################
+# Output        #
+#################
+
+def git_commit():
+
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, old):
+
+    print('{:<55} {:>10} {:>10} {:>8}'.format('benchmark', 'old ms', 'new ms', 'ratio'))
+
+    for name, new in sorted(results.items()):
+        if name not in old:
+            continue
+
+        a, b = old[name]['mean_ms'], new['mean_ms']
+        print('{:<55} {:>10.3f} {:>10.3f} {:>7.2f}x'.format(name, a, b, b / a if a else float('nan')))
+
+########################################################
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark data loading and callbacks')
+    parser.add_argument('-o', '--output', help='write the results to this json file')
+    parser.add_argument('--compare', help='json results from an earlier run to compare with')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--quick', action='store_true', help='skip the larger synthetic sizes')
+    args = parser.parse_args()
+
+    import app
+
+    results = {}
+    results.update(bench_load(args.repeat))
+    results.update(bench_startup(args.repeat))
+    results.update(bench_callbacks(app, 'snapshot', args.repeat))
+
+    # Synthetic data, (days, regions)
+    scales = [(365, 55), (730, 55), (365, 220)]
+
+    if not args.quick:
+        scales += [(1460, 55), (730, 880)]
+
+    results.update(bench_scaling(app, scales, args.repeat))
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'figure_cache': os.environ.get('FIGURE_CACHE'),
+        },
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)['results'])
+    else:
+        for name, r in sorted(results.items()):
+            print('{:<55} {:>10.3f} ms{}'.format(name, r['mean_ms'], '  {:>10,} bytes'.format(r['mean_bytes']) if 'mean_bytes' in r else ''))
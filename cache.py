@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+#
+#########
+# Cache #
+#########
+#
+# Description: Caches the serialized json dash sends back for callbacks whose
+# output only depends on their inputs and the data version (the state tab).
+# A hit is answered before dash runs the callback at all. Entries live in an
+# in memory LRU and, optionally, on disk so every worker can use them. The
+# first hit for each content encoding stores the compressed body as well so
+# later hits aren't compressed again
+#
+import os
+import json
+import time
+import glob
+import shutil
+import hashlib
+import threading
+import collections
+
+import flask
+
+import data_store
+import transport
+
+# On disk cache shared by the workers, one directory per data version
+CACHE_DIR = os.path.join(data_store.DATA_DIR, 'cache')
+
+# Set on the requests prewarm() makes
+PREWARM_HEADER = 'X-Cache-Prewarm'
+
+
+class ResponseCache(object):
+
+    def __init__(self, maxsize=1024, ttl=None, directory=None, maxfiles=4096):
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.directory = directory
+
+        # Files per version on disk, past it entries are only kept in memory
+        self.maxfiles = maxfiles
+
+        self.hits = 0
+        self.misses = 0
+
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, version, key):
+
+        name = hashlib.sha1(key.encode()).hexdigest() + '.json'
+
+        return os.path.join(self.directory, version, name)
+
+    def get(self, version, key, disk=True):
+
+        with self._lock:
+            item = self._items.get((version, key))
+
+            if item is not None:
+                stored, data = item
+
+                if self.ttl is None or time.time() - stored < self.ttl:
+                    self._items.move_to_end((version, key))
+                    self.hits += 1
+                    return data
+
+                del self._items[(version, key)]
+
+        # Another worker may have already built it
+        if self.directory is not None and disk:
+            path = self._path(version, key)
+
+            try:
+                if self.ttl is None or time.time() - os.path.getmtime(path) < self.ttl:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+
+                    self._remember(version, key, data)
+                    self.hits += 1
+                    return data
+
+            except OSError:
+                pass
+
+        self.misses += 1
+
+        return None
+
+    def set(self, version, key, data, disk=True):
+
+        self._remember(version, key, data)
+
+        if self.directory is not None and disk:
+            path = self._path(version, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            # (counted on every write, since all the workers write here)
+            if not os.path.exists(path) and self._files(version) >= self.maxfiles:
+                return
+
+            tmp = '{}.{}.tmp'.format(path, os.getpid())
+
+            with open(tmp, 'wb') as f:
+                f.write(data)
+
+            os.replace(tmp, path)
+
+    def _files(self, version):
+
+        with os.scandir(os.path.join(self.directory, version)) as entries:
+            return sum(1 for e in entries if e.name.endswith('.json'))
+
+    def _remember(self, version, key, data):
+
+        with self._lock:
+            self._items[(version, key)] = (time.time(), data)
+            self._items.move_to_end((version, key))
+
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def drop_old(self, version):
+
+        # Forget every entry that isn't for `version`
+        with self._lock:
+            for k in [k for k in self._items if k[0] != version]:
+                del self._items[k]
+
+        if self.directory is not None:
+            for path in glob.glob(os.path.join(self.directory, '*')):
+                if os.path.basename(path) != version:
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def __contains__(self, item):
+
+        version, key = item
+
+        with self._lock:
+            if item in self._items:
+                return True
+
+        return self.directory is not None and os.path.exists(self._path(version, key))
+
+
+def request_key(body):
+
+    # The output plus every input and state value
+    inputs = body.get('inputs', []) + body.get('state', [])
+    values = [[i.get('id'), i.get('property'), i.get('value')] for i in inputs]
+
+    return json.dumps([body.get('output'), values], sort_keys=True)
+
+
+def install(server, response_cache, outputs, get_version, memory_only=()):
+
+    # Answer cached callbacks before dash dispatches them. Outputs in
+    # memory_only take any input a client sends (the compare tab's list of
+    # states), so they stay in the bounded LRU and never go to disk
+    @server.before_request
+    def cached_response():
+
+        if flask.request.path != '/_dash-update-component':
+            return None
+
+        body = flask.request.get_json(silent=True) or {}
+
+        output = body.get('output')
+
+        if output not in outputs:
+            return None
+
+        disk = output not in memory_only
+
+        version = get_version()
+        key = request_key(body)
+
+        encoding = transport.accepted(flask.request)
+        encoded = encoded_key(key, encoding)
+
+        if encoding is not None and (version, encoded) in response_cache:
+            data = response_cache.get(version, encoded, disk)
+
+        else:
+            data = response_cache.get(version, key, disk)
+
+            if data is not None and encoding is not None:
+                data = transport.compress(data, encoding)
+                response_cache.set(version, encoded, data, disk)
+
+        if data is not None:
+            response = flask.Response(data, mimetype='application/json')
+
+            # (flask-compress leaves responses with an encoding alone)
+            if encoding is not None:
+                response.headers['Content-Encoding'] = encoding
+                response.headers['Vary'] = 'Accept-Encoding'
+
+            return response
+
+        flask.g.cache_key = (version, key, disk)
+
+        return None
+
+    @server.after_request
+    def store_response(response):
+
+        key = flask.g.pop('cache_key', None)
+
+        if key is not None and response.status_code == 200:
+            response_cache.set(key[0], key[1], response.get_data(), key[2])
+
+        return response
+
+
+def encoded_key(key, encoding):
+
+    return key if encoding is None else '{}|{}'.format(key, encoding)
+
+
+def callback_body(output, inputs):
+
+    # Request body dash sends for a callback, inputs is [(id, property, value)]
+    # and a multi output callback's output looks like '..a.prop...b.prop..'
+    outputs = [dict(zip(['id', 'property'], o.split('.'))) for o in output.strip('.').split('...')]
+
+    return {
+        'output': output,
+        'outputs': outputs if output.startswith('..') else outputs[0],
+        'inputs': [{'id': i, 'property': p, 'value': v} for i, p, v in inputs],
+        'changedPropIds': ['{}.{}'.format(i, p) for i, p, v in inputs],
+    }
+
+
+def prewarm(server, bodies):
+
+    # Run each callback once through the app so its response gets cached,
+    # then ask for it in each encoding so those are stored too
+    client = server.test_client()
+
+    # (the header keeps these out of the callback metrics)
+    for body in bodies:
+        for encoding in [None] + list(transport.ENCODINGS):
+            headers = {PREWARM_HEADER: '1'}
+
+            if encoding is not None:
+                headers['Accept-Encoding'] = encoding
+
+            client.post('/_dash-update-component', data=json.dumps(body), content_type='application/json', headers=headers)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+#
+############
+# Cleaning #
+############
+#
+# Description: Fixes up the state (or county) rows once when the arrays are
+# built (see metrics.state_arrays), so every view works from the same
+# corrected numbers instead of each one patching over bad days. Duplicate
+# days are dropped, revisions from later snapshots applied, missing days
+# interpolated and cumulative counts that go down held at their high water
+# mark. The raw counts are kept next to the corrected ones and every row
+# gets flags saying what was changed
+#
+import numpy as np
+import pandas as pd
+
+# Row flags, or'ed together
+NEGATIVE = 1    # the raw cumulative count went down on this day
+GAP = 2         # the day was missing, its counts are interpolated
+DUPLICATE = 4   # the day had more than one row, the last one is used
+REVISED = 8     # a later snapshot changed the day's counts
+
+
+def dedupe(df, key='state'):
+
+    # df is sorted by (key, date)
+    dup = df.duplicated([key, 'date'], keep=False).values
+    keep = ~df.duplicated([key, 'date'], keep='last').values
+
+    flags = np.where(dup[keep], DUPLICATE, 0).astype('uint8')
+
+    return df[keep].reset_index(drop=True), flags
+
+
+def revise(df, flags, revisions, key='state'):
+
+    # Counts for the same (key, date) from a later snapshot replace the stored ones
+    if revisions is None or not len(revisions):
+        return df, flags
+
+    revisions = revisions.assign(**{key: revisions[key].astype(str)})
+    merged = pd.DataFrame({key: df[key].astype(str), 'date': df['date']}).merge(
+            revisions, on=[key, 'date'], how='left')
+
+    revised = merged['cases'].notna().values
+
+    if not revised.any():
+        return df, flags
+
+    df = df.copy()
+    df.loc[revised, 'cases'] = merged.loc[revised, 'cases'].values.astype('int64')
+    df.loc[revised, 'deaths'] = merged.loc[revised, 'deaths'].values.astype('int64')
+
+    return df, flags | np.where(revised, REVISED, 0).astype('uint8')
+
+
+def fill_gaps(dates, starts, ends, columns, flags):
+
+    # Insert the days missing inside each state's range, with the cumulative
+    # columns interpolated linearly between the days either side
+    day = dates.astype('datetime64[D]').astype('int64')
+
+    first = day[starts]
+    length = day[ends - 1] - first + 1
+
+    if (length == ends - starts).all():
+        return dates, starts, ends, columns, flags
+
+    new_ends = np.cumsum(length)
+    new_starts = new_ends - length
+    n = new_ends[-1]
+
+    # where every existing row lands in the filled arrays
+    pos = np.repeat(new_starts - first, ends - starts) + day
+
+    filled_day = np.arange(n) - np.repeat(new_starts - first, length)
+
+    filled_flags = np.full(n, GAP, dtype='uint8')
+    filled_flags[pos] = flags
+
+    # the first and last day of each state always exist, so interpolating
+    # over the whole array never crosses from one state into the next
+    filled = [np.round(np.interp(np.arange(n), pos, c)).astype(c.dtype) for c in columns]
+
+    return filled_day.astype('datetime64[D]').astype('datetime64[ns]'), new_starts, new_ends, filled, filled_flags
+
+
+def correct(cum, starts, ends):
+
+    # Running maximum within each state, a drop in the cumulative count is
+    # held at the previous high until the count passes it again
+    if not len(cum):
+        return cum.copy(), np.zeros(0, dtype=bool)
+
+    # offsetting each state above the last keeps the maximum from carrying over
+    offset = np.repeat(np.arange(len(starts), dtype='int64') * (int(cum.max()) + 1), ends - starts)
+    corrected = np.maximum.accumulate(cum + offset) - offset
+
+    negative = np.zeros(len(cum), dtype=bool)
+    negative[1:] = cum[1:] < cum[:-1]
+    negative[starts] = False
+
+    return corrected, negative
+
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+#
+############
+# Counties #
+############
+#
+# Description: County drill down for the state tab. Each state's counties are
+# loaded from their own partition of the county store the first time they're
+# asked for, and only the most recently used partitions stay in memory
+#
+import os
+import functools
+
+import data_store
+
+# States whose county data is kept in memory per worker
+COUNTY_PARTITIONS = int(os.environ.get('COUNTY_PARTITIONS', 8))
+
+
+def available():
+
+    return os.path.isdir(data_store.COUNTIES_STORE)
+
+
+@functools.lru_cache(maxsize=COUNTY_PARTITIONS)
+def _load(state, mtime):
+
+    import analytics
+    import metrics
+    import query
+
+    df = data_store.load_county_partition(state)
+
+    if df is None:
+        return None
+
+    # Same arrays, table and metrics as the states, keyed by county
+    table = query.StateTable(metrics.state_arrays(df, key='county'))
+
+    return table, metrics.build_state_metrics(table), analytics.build_analytics(table)
+
+
+def get(state):
+
+    # The file's mtime is part of the key so a rebuilt store gets reloaded
+    try:
+        mtime = os.path.getmtime(data_store.county_partition(state))
+    except OSError:
+        return None
+
+    return _load(state, mtime)
@@ -9,6 +9,12 @@ yesterday=$(date +"%m.%d" -d yesterday)
 
 mv us-states.csv us-states_$yesterday.csv
 
+# append the new days to the local store
+python3 ../data_store.py update us-states_$yesterday.csv
+
+# and keep the snapshot in the history store as a delta
+python3 ../history.py add us-states_$yesterday.csv
+
 
 
 
@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+#
+##############
+# Data Store #
+##############
+#
+# Description: Ingests the nytimes csv files (or the dated snapshots in data/)
+# into local feather files with compact dtypes so the app can load them from
+# disk at startup instead of downloading them from github
+#
+# The state store is a directory of feather parts: a full build writes one
+# part and each update appends a small part holding only the new dates, plus
+# a small revisions part when the snapshot changed days already stored
+#
+# Usage: python data_store.py [--remote] [--counties]
+#        python data_store.py update [csv]
+#
+import io
+import os
+import glob
+import hashlib
+import argparse
+
+# pandas and pyarrow are imported by the functions that use them, so the
+# app can import the paths below without paying for them (see LAZY_START)
+
+# Remote csv files
+STATES_URL = 'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-states.csv'
+COUNTIES_URL = 'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-counties.csv'
+
+# Local files
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+STATES_STORE = os.path.join(DATA_DIR, 'us-states')
+# County store, one feather file per state plus the rows for the last date
+COUNTIES_STORE = os.path.join(DATA_DIR, 'us-counties')
+COUNTIES_LATEST = os.path.join(DATA_DIR, 'us-counties-latest.feather')
+
+# 2019 census population estimates (territories from the census
+# international database)
+POPULATION_CSV = os.path.join(DATA_DIR, 'us-states-population.csv')
+
+# Compact the state store once it has this many parts
+MAX_PARTS = 30
+
+# Compact dtypes for the csv columns
+DTYPES = {
+    'state': 'category',
+    'fips': 'int32',
+    'cases': 'int64',
+    'deaths': 'int64',
+}
+
+##################
+# Reading csv's  #
+##################
+
+def read_csv(src, county=False):
+
+    import pandas as pd
+
+    if county:
+        # county rows can be missing fips (NYC, Unknown) or deaths
+        df = pd.read_csv(src, dtype={'county': 'category', 'state': 'category'}, parse_dates=['date'])
+
+        df['fips'] = df['fips'].fillna(0).astype('int32')
+        df['deaths'] = df['deaths'].fillna(0).astype('int64')
+        df['cases'] = df['cases'].astype('int64')
+
+    else:
+        df = pd.read_csv(src, dtype=DTYPES, parse_dates=['date'])
+
+    return df
+
+
+def last_line_date(path):
+
+    import pandas as pd
+
+    # Read the date off the last line without parsing the whole file
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        f.seek(max(pos - 256, 0))
+        last = f.read().rstrip(b'\n').split(b'\n')[-1]
+
+    return pd.Timestamp(last.split(b',')[0].decode())
+
+
+def read_csv_after(path, after, block=64 * 1024):
+
+    # Scan backwards from the end of the file until we reach a line dated on
+    # or before `after`, then parse only the lines past it
+    after = after.strftime('%Y-%m-%d').encode()
+
+    with open(path, 'rb') as f:
+        header = f.readline()
+        start = f.tell()
+
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        tail = b''
+
+        while pos > start:
+            step = min(block, pos - start)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+
+            # first full line in the buffer (the first one may be cut off)
+            lines = tail.split(b'\n')
+            first = lines[1] if pos > start and len(lines) > 1 else lines[0]
+
+            if first and first.split(b',')[0] <= after:
+                break
+
+    lines = [l for l in tail.split(b'\n') if l.strip()]
+
+    if pos > start:
+        lines = lines[1:]
+
+    lines = [l for l in lines if l.split(b',')[0] > after]
+
+    return read_csv(io.BytesIO(header + b'\n'.join(lines) + b'\n'))
+
+
+def latest_snapshot():
+
+    # Snapshot names only carry month.day so order them by their last date
+    files = glob.glob(os.path.join(DATA_DIR, 'us-states_*.csv'))
+
+    if not files:
+        return None
+
+    return max(files, key=last_line_date)
+
+#################
+# Feather store #
+#################
+
+def write_store(df, path):
+
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+
+    # Uncompressed so the file can be memory mapped on load,
+    # written to a temp file first so readers never see half a file
+    tmp = path + '.tmp'
+    feather.write_feather(table, tmp, compression='uncompressed')
+    os.replace(tmp, path)
+
+
+def read_store(path, columns=None):
+
+    import pyarrow.feather as feather
+
+    table = feather.read_table(path, columns=columns, memory_map=True)
+
+    return table.to_pandas()
+
+
+def store_parts(path=STATES_STORE):
+
+    return sorted(glob.glob(os.path.join(path, 'part-*.feather')))
+
+
+def revision_parts(path=STATES_STORE):
+
+    return sorted(glob.glob(os.path.join(path, 'revisions-*.feather')))
+
+
+def store_files(path=STATES_STORE):
+
+    # Everything the loaded data depends on (see store_key)
+    return store_parts(path) + revision_parts(path)
+
+
+def store_key(files):
+
+    # Name, mtime and size of each file. A full build writes part-0000 again,
+    # so the names alone don't say whether the data changed
+    key = []
+
+    for p in files:
+        try:
+            st = os.stat(p)
+        except FileNotFoundError:
+            continue
+
+        key.append((os.path.basename(p), st.st_mtime_ns, st.st_size))
+
+    return tuple(key)
+
+
+def read_parts(path=STATES_STORE, columns=None):
+
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    tables = [feather.read_table(p, columns=columns, memory_map=True) for p in store_parts(path)]
+
+    return pa.concat_tables(tables).to_pandas()
+
+
+def write_part(df, path=STATES_STORE):
+
+    os.makedirs(path, exist_ok=True)
+
+    parts = store_parts(path)
+    n = int(os.path.basename(parts[-1])[5:-8]) + 1 if parts else 0
+
+    write_store(df, os.path.join(path, 'part-{:04d}.feather'.format(n)))
+
+
+def write_revisions(df, path=STATES_STORE):
+
+    parts = revision_parts(path)
+    n = int(os.path.basename(parts[-1])[10:-8]) + 1 if parts else 0
+
+    write_store(df, os.path.join(path, 'revisions-{:04d}.feather'.format(n)))
+
+
+def last_stored_date(path=STATES_STORE):
+
+    import pandas as pd
+    import pyarrow.feather as feather
+
+    parts = store_parts(path)
+
+    if not parts:
+        return None
+
+    # Parts are appended in date order so only the last one needs reading
+    dates = feather.read_table(parts[-1], columns=['date'], memory_map=True)
+
+    return pd.Timestamp(dates.column('date').to_pandas().max())
+
+
+def build_states(src=None, path=STATES_STORE):
+
+    if src is None:
+        src = latest_snapshot() or STATES_URL
+
+    df = read_csv(src)
+    df = df.sort_values(['date', 'state'], kind='mergesort')
+
+    for p in store_files(path):
+        os.remove(p)
+
+    write_part(df, path)
+
+    return df
+
+
+def validate(df, after=None):
+
+    if list(df.columns) != ['date', 'state', 'fips', 'cases', 'deaths']:
+        raise ValueError('unexpected columns: {}'.format(list(df.columns)))
+
+    if df[['cases', 'deaths']].lt(0).any().any():
+        raise ValueError('negative cumulative cases or deaths')
+
+    if df.duplicated(['date', 'state']).any():
+        raise ValueError('duplicate (date, state) rows')
+
+    if after is not None and (df['date'] <= after).any():
+        raise ValueError('rows dated on or before {}'.format(after.date()))
+
+
+def update_states(src=None, path=STATES_STORE):
+
+    if src is None:
+        src = latest_snapshot()
+
+    last = last_stored_date(path)
+
+    if last is None:
+        return build_states(src, path)
+
+    # The tail of a local snapshot says whether it has any new days, most
+    # don't and aren't parsed any further. One that has is read in full and
+    # every day it shares with the store is checked for revisions
+    if os.path.exists(str(src)):
+        tail = read_csv_after(src, last)
+
+        if not len(tail):
+            return tail
+
+    df = read_csv(src)
+
+    # Same (date, state) in an overlapping snapshot, keep the first one
+    df = df.drop_duplicates(['date', 'state'])
+    df = df.sort_values(['date', 'state'], kind='mergesort')
+
+    # A snapshot no newer than the store is one already applied (or older),
+    # its counts for days restated since would rewind them, not revise them
+    if not len(df) or df['date'].max() <= last:
+        return df.iloc[:0]
+
+    # Checked before anything is written, a bad snapshot leaves no parts
+    validate(df)
+
+    new = df[df['date'] > last]
+    validate(new, after=last)
+
+    revised = find_revisions(df[df['date'] <= last], path)
+
+    if len(revised):
+        write_revisions(revised, path)
+
+    write_part(new, path)
+
+    if len(store_parts(path)) > MAX_PARTS:
+        compact(path)
+
+    return new
+
+
+def find_revisions(df, path=STATES_STORE):
+
+    # Rows whose counts differ from what's stored (with earlier revisions applied)
+    import pandas as pd
+
+    columns = ['date', 'state', 'cases', 'deaths']
+
+    known = [read_parts(path, columns=columns)]
+
+    if revision_parts(path):
+        known.append(load_revisions(path))
+
+    known = pd.concat(known, ignore_index=True)
+    known = known.astype({'state': str})
+    known = known.drop_duplicates(['date', 'state'], keep='last')
+
+    both = df[columns].astype({'state': str}).merge(known, on=['date', 'state'], suffixes=('', '_known'))
+    changed = (both['cases'] != both['cases_known']) | (both['deaths'] != both['deaths_known'])
+
+    return both.loc[changed, columns].reset_index(drop=True)
+
+
+def compact(path=STATES_STORE):
+
+    parts = store_parts(path)
+
+    if len(parts) < 2:
+        return
+
+    df = read_parts(path)
+
+    # Write the merged part after the last one, then drop the old parts
+    write_part(df, path)
+
+    for p in parts:
+        os.remove(p)
+
+
+def county_partition(state):
+
+    return os.path.join(COUNTIES_STORE, state.replace(' ', '_') + '.feather')
+
+
+def build_counties(src=COUNTIES_URL):
+
+    df = read_csv(src, county=True)
+    df = df.sort_values('date', kind='mergesort')
+
+    os.makedirs(COUNTIES_STORE, exist_ok=True)
+
+    # Partition by state so a worker only ever loads the states it's asked for
+    for state, part in df.groupby('state', observed=True, sort=False):
+        part = part.sort_values(['county', 'date'], kind='mergesort')
+
+        part['county'] = part['county'].cat.remove_unused_categories()
+        part['state'] = part['state'].cat.remove_unused_categories()
+
+        write_store(part, county_partition(state))
+
+    write_store(df[df['date'] == df['date'].iloc[-1]], COUNTIES_LATEST)
+
+    return df
+
+
+def data_version(df, revisions=None):
+
+    # Last date plus a hash of the counts and any revisions, so appended
+    # days, revised days and a rebuild from a restated snapshot each give a
+    # new version
+    import pandas as pd
+
+    columns = ['date', 'state', 'cases', 'deaths']
+    digest = hashlib.sha1()
+
+    for part in [df, revisions]:
+        if part is not None and len(part):
+            digest.update(pd.util.hash_pandas_object(part[columns], index=False).values.tobytes())
+
+    return '{}.{}'.format(df['date'].max().strftime('%Y%m%d'), digest.hexdigest()[:12])
+
+
+def load_states(path=STATES_STORE):
+
+    if not store_parts(path):
+        return build_states(path=path)
+
+    return read_parts(path)
+
+
+def load_revisions(path=STATES_STORE):
+
+    # Latest revised counts per (date, state), or None
+    import pandas as pd
+
+    parts = revision_parts(path)
+
+    if not parts:
+        return None
+
+    df = pd.concat([read_store(p) for p in parts], ignore_index=True)
+
+    return df.drop_duplicates(['date', 'state'], keep='last').reset_index(drop=True)
+
+
+def load_county_partition(state):
+
+    path = county_partition(state)
+
+    if not os.path.exists(path):
+        return None
+
+    return read_store(path)
+
+
+def load_latest_counties(columns=None):
+
+    # Only the rows for the last date, kept in their own small file
+    if not os.path.exists(COUNTIES_LATEST):
+        return None
+
+    return read_store(COUNTIES_LATEST, columns=columns)
+
+
+def load_population():
+
+    import pandas as pd
+
+    df = pd.read_csv(POPULATION_CSV, dtype={'population': 'int64'})
+
+    return df.set_index('state')['population']
+
+########################################################
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Build the local feather data store')
+    parser.add_argument('command', nargs='?', choices=['build', 'update'], default='build')
+    parser.add_argument('csv', nargs='?', help='csv file or url to read (default: newest snapshot in data/)')
+    parser.add_argument('--remote', action='store_true', help='pull the state csv from github instead of data/')
+    parser.add_argument('--counties', action='store_true', help='also pull the county csv from github')
+    args = parser.parse_args()
+
+    src = STATES_URL if args.remote else args.csv
+
+    if args.command == 'update':
+        df = update_states(src)
+        print('states: appended {:,} rows, store now through {}'.format(len(df), last_stored_date().date()))
+
+        if revision_parts():
+            print('states: {:,} revised rows'.format(len(load_revisions())))
+
+    else:
+        df = build_states(src)
+        print('states: {:,} rows through {}'.format(len(df), df['date'].iloc[-1].date()))
+
+    if args.counties:
+        df = build_counties()
+        print('counties: {:,} rows through {}'.format(len(df), df['date'].iloc[-1].date()))
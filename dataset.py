@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+#
+###########
+# Dataset #
+###########
+#
+# Description: Holds the loaded data and everything derived from it as one
+# immutable Dataset. A background thread reloads the store when it changes
+# and swaps in a new Dataset in one assignment, so a callback that grabs
+# dataset.get() once sees a consistent version for the whole request
+#
+import os
+import time
+import fcntl
+import logging
+import threading
+import collections
+
+import data_store
+import instrument
+import maps
+
+# Seconds between checks for new data
+REFRESH_INTERVAL = int(os.environ.get('REFRESH_INTERVAL', 3600))
+
+# Pull new days from github on each refresh instead of waiting for
+# data/update_states.sh to add them
+REFRESH_REMOTE = os.environ.get('REFRESH_REMOTE') == '1'
+
+# Memory map one shared copy of the state arrays instead of loading
+# them into every worker (see shared.py)
+SHARED_DATA = os.environ.get('SHARED_DATA') == '1'
+
+# Start serving straight away and load the data on the refresher thread
+# (or on first use) instead of before the app is ready
+LAZY_START = os.environ.get('LAZY_START') == '1'
+
+# Only one worker pulls from github at a time
+LOCK_FILE = os.path.join(data_store.DATA_DIR, '.update.lock')
+
+# Touched after each pull, the other workers skip theirs until the next interval
+PULL_STAMP = os.path.join(data_store.DATA_DIR, '.last_pull')
+
+log = logging.getLogger(__name__)
+
+Dataset = collections.namedtuple('Dataset', [
+    'version',        # data version, used as a cache key
+    'parts',          # store parts it was loaded from
+    'key',            # their names, mtimes and sizes, see data_store.store_key
+    'arrays',         # state columns sorted by (state, date), see metrics.py
+    'table',          # query api over the arrays, see query.py
+    'state_metrics',  # per state series and summary numbers
+    'usa_metrics',    # national totals and series
+    'analytics',      # rolling averages, rates and growth, see analytics.py
+    'forecast',       # projected daily counts, see forecast.py
+    'maps',           # choropleth figure for each map view
+    'map_json',       # the same, serialized
+    'date',           # last date, as shown on the page
+    'modified',       # when the store last changed, for Last-Modified
+])
+
+
+def build(parts=None, arrays=None):
+
+    # Imported here so the app can start before numpy and pandas are loaded
+    import analytics
+    import forecast
+    import metrics
+    import query
+    import shared
+
+    # Taken before the data is read, so a change during the load is seen
+    # by the next reload
+    key = data_store.store_key(parts) if parts is not None else None
+
+    # arrays can be passed in, e.g. synthetic data for bench.py
+    if arrays is None and SHARED_DATA:
+        arrays = shared.load()
+    elif arrays is None:
+        arrays = metrics.state_arrays(data_store.load_states(), revisions=data_store.load_revisions())
+
+    if parts is None:
+        parts = tuple(data_store.store_files())
+        key = data_store.store_key(parts)
+
+    table = query.StateTable(arrays)
+
+    # Newest store file, or now for data that didn't come from the store
+    modified = max((os.path.getmtime(p) for p in parts if os.path.exists(p)), default=time.time())
+
+    map_figures, map_json = maps.build_maps(arrays)
+
+    usa_metrics = metrics.build_usa_metrics(arrays)
+
+    return Dataset(
+        version=arrays['version'],
+        parts=parts,
+        key=key,
+        arrays=arrays,
+        table=table,
+        state_metrics=metrics.build_state_metrics(table),
+        usa_metrics=usa_metrics,
+        analytics=analytics.build_analytics(table, data_store.load_population()),
+        forecast=forecast.build_forecast(table, usa_metrics['daily']),
+        maps=map_figures,
+        map_json=map_json,
+        date=arrays['date'].max().astype('datetime64[D]').item().strftime('%m-%d-%Y'),
+        modified=modified,
+    )
+
+#################
+# Current data  #
+#################
+
+current = None
+_load_lock = threading.Lock()
+
+# Functions called with each new Dataset from the refresher thread,
+# e.g. to warm caches off the request path
+listeners = []
+
+
+def get():
+
+    if current is None:
+        reload()
+
+    return current
+
+
+def ready():
+
+    return current is not None
+
+
+def reload():
+
+    global current
+
+    with _load_lock:
+        parts = tuple(data_store.store_files())
+
+        # A full rebuild reuses the part names, so the mtimes and sizes
+        # are compared as well
+        if current is not None and parts and data_store.store_key(parts) == current.key:
+            return False
+
+        with instrument.timer('data_load'):
+            data = build(parts or None)
+
+        # Swap in the new version in one go
+        current = data
+
+    log.info('loaded data version %s', data.version)
+
+    return True
+
+
+def pull_remote():
+
+    with open(LOCK_FILE, 'w') as lock:
+
+        # Another worker is pulling, reload() picks up what it writes
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+
+        try:
+            # or one already pulled this interval
+            if os.path.exists(PULL_STAMP) and time.time() - os.path.getmtime(PULL_STAMP) < REFRESH_INTERVAL / 2:
+                return False
+
+            with instrument.timer('remote_pull'):
+                df = data_store.update_states(data_store.STATES_URL)
+
+            with open(PULL_STAMP, 'w'):
+                pass
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+    log.info('pulled %d new rows from github', len(df))
+
+    return True
+
+
+def refresh():
+
+    if REFRESH_REMOTE:
+        pull_remote()
+
+    return reload()
+
+#####################
+# Background thread #
+#####################
+
+_refresher = None
+
+
+def _notify(data):
+
+    for fn in listeners:
+        try:
+            fn(data)
+        except Exception:
+            log.exception('data listener %r failed', fn)
+
+
+def _run():
+
+    # With LAZY_START this is where the data gets loaded
+    try:
+        get()
+    except Exception:
+        log.exception('data load failed')
+    else:
+        _notify(current)
+
+    while REFRESH_INTERVAL > 0:
+        time.sleep(REFRESH_INTERVAL)
+
+        # Keep serving the old version if anything goes wrong
+        try:
+            if refresh():
+                _notify(current)
+        except Exception:
+            log.exception('data refresh failed')
+
+
+def start_refresher():
+
+    global _refresher
+
+    if not LAZY_START:
+        get()
+
+    if _refresher is None:
+        _refresher = threading.Thread(target=_run, name='data-refresher', daemon=True)
+        _refresher.start()
+
+
+def _after_fork():
+
+    # Threads don't survive a fork (gunicorn --preload), so each worker
+    # starts its own, and a load that was half done in the parent starts over
+    global _refresher, _load_lock
+
+    _load_lock = threading.Lock()
+
+    if _refresher is not None:
+        _refresher = None
+        start_refresher()
+
+
+os.register_at_fork(after_in_child=_after_fork)
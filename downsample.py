@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+#
+##############
+# Downsample #
+##############
+#
+# Description: Thins out long daily series before they're sent to the browser.
+# The series is cut into equal buckets and the lowest and highest point of
+# each one are kept, so peaks and dips survive where plain striding would
+# skip them. Every bucket is reduced at once (a reshape and an argmin/argmax),
+# no loop over buckets
+#
+import os
+
+import numpy as np
+
+# Points sent per graph, about the width of a graph in pixels
+GRAPH_POINTS = int(os.environ.get('GRAPH_POINTS', 500))
+
+
+def minmax(y, points):
+
+    # Indices of the points to keep, always the first and last
+    n = len(y)
+
+    if points >= n or points < 4:
+        return np.arange(n)
+
+    # missing days count as 0 when picking, the values sent are untouched
+    y = np.nan_to_num(np.asarray(y, dtype='float64'))
+
+    # two points from each bucket, over the inner points
+    inner = y[1:-1]
+    size = -(-len(inner) // ((points - 2) // 2))
+    buckets = -(-len(inner) // size)
+
+    # padded with the last value to fill the last bucket
+    grid = np.pad(inner, (0, buckets * size - len(inner)), mode='edge').reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+
+    picks = np.concatenate([offsets + grid.argmin(axis=1), offsets + grid.argmax(axis=1)])
+
+    # a pick in the padding stands for the last inner point
+    picks = np.minimum(picks, len(inner) - 1) + 1
+
+    return np.unique(np.concatenate([[0, n - 1], picks]))
+
+
+def thin(columns, points, tail=0):
+
+    # Rows to keep so every column's shape survives, plus the last `tail`
+    # rows at full resolution. The columns are the same length and each
+    # gets half the points since they share the x values
+    n = len(columns[0])
+
+    if not points or n <= points:
+        return np.arange(n)
+
+    keep = np.arange(max(n - tail, 0), n)
+
+    for y in columns:
+        keep = np.union1d(keep, minmax(y, max(points // len(columns), 4)))
+
+    return keep
@@ -0,0 +1,38 @@
+/* Static export
+   Loaded before the dash renderer in the page export.py writes. Callback
+   requests are answered from the json files saved next to the page, and
+   views that weren't exported get no update (204), as if the callback had
+   prevented it
+–––––––––––––––––––––––––––––––––––––––––––––––––– */
+
+(function() {
+
+    var fetch = window.fetch.bind(window);
+
+    // Same as export.slug
+    function slug(text) {
+        return text.replace(/[^A-Za-z0-9_]+/g, '-').replace(/^-+|-+$/g, '');
+    }
+
+    // callbacks/<output>/<input and state values>.json
+    function callbackPath(body) {
+
+        var values = body.inputs.concat(body.state || []).map(function(i) {
+            return Array.isArray(i.value) ? i.value.join('_') : String(i.value);
+        });
+
+        return 'callbacks/' + slug(body.output) + '/' + slug(values.join('_')) + '.json';
+    }
+
+    window.fetch = function(url, options) {
+
+        if (typeof url == 'string' && /_dash-update-component$/.test(url) && options && options.method == 'POST') {
+            return fetch(callbackPath(JSON.parse(options.body))).then(function(res) {
+                return res.ok ? res : new Response(null, {status: 204});
+            });
+        }
+
+        return fetch(url, options);
+    };
+
+})();
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+#
+##########
+# Export #
+##########
+#
+# Description: Writes the dashboard out as static files for a CDN or nginx.
+# Every read only view (the three tabs, both map views, every state and its
+# counties) is run once through the app's own callbacks, in parallel in a
+# process pool, and each response is saved as a json file next to the page,
+# the layout and the javascript. The exported page is the same dash page
+# with export.js loaded first, which answers the callback requests from those
+# files instead of the server, so no python runs per request. Views that
+# weren't exported (zooming, other comparisons) do nothing, the dash server
+# is still there for those
+#
+# The cases/deaths radio buttons are drawn in the browser from the state's
+# series (assets/graphs.js), so one file per state covers every mode
+#
+# Usage: python export.py [-o static] [--jobs 4]
+#
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import multiprocessing
+import concurrent.futures
+
+# The data on disk, no refresh, and the callbacks run rather than cached
+os.environ['REFRESH_INTERVAL'] = '0'
+os.environ['FIGURE_CACHE'] = '0'
+os.environ.pop('LAZY_START', None)
+
+import cache
+import transport
+
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+# Suffix of the precompressed copies (nginx gzip_static / brotli_static)
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# The app, in each process of the pool
+app = None
+
+#################
+# Callbacks     #
+#################
+
+def slug(text):
+
+    # Same as export.js
+    return re.sub(r'[^A-Za-z0-9_]+', '-', text).strip('-')
+
+
+def callback_path(output, values):
+
+    # callbacks/<output>/<input and state values>.json
+    parts = ['_'.join(v) if isinstance(v, list) else str(v) for v in values]
+
+    return os.path.join('callbacks', slug(output), slug('_'.join(parts)) + '.json')
+
+
+def views(data):
+
+    # (output, inputs, state) for every read only view
+    import counties
+
+    out = []
+
+    for tab in ['tab-1', 'tab-2', 'tab-3']:
+        out.append(('tabs-content.children', [('tabs', 'value', tab)], None))
+
+    for view in data.maps:
+        out.append(('usa-map.figure', [('map_view', 'value', view)], None))
+
+    for state in data.state_metrics['states']:
+        out.append((app.STATE_OUTPUTS, [('my-dropdown2', 'value', state)], None))
+        out.append((app.COUNTY_OPTIONS, [('my-dropdown2', 'value', state)], None))
+
+        county_data = counties.get(state)
+
+        if county_data is not None:
+            for county in county_data[0].states():
+                out.append((app.COUNTY_OUTPUTS, [('county-dropdown', 'value', county)], [('my-dropdown2', 'value', state)]))
+
+    # The comparison the tab opens with
+    selection = [s for s in app.COMPARE_DEFAULT if s in data.table]
+    out.append((app.COMPARE_OUTPUTS, [('compare-dropdown', 'value', selection)], None))
+
+    return out
+
+
+def write(out_dir, path, body):
+
+    # The file, and a compressed copy per encoding
+    path = os.path.join(out_dir, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, 'wb') as f:
+        f.write(body)
+
+    for encoding, suffix in SUFFIXES.items():
+        with open(path + suffix, 'wb') as f:
+            f.write(transport.compress(body, encoding))
+
+    return len(body)
+
+
+def render(out_dir, batch):
+
+    # Run each view through the app and save what it sends back,
+    # a view that sends nothing (204) gets no file
+    client = app.server.test_client()
+    written = 0
+
+    for output, inputs, state in batch:
+        body = cache.callback_body(output, inputs)
+
+        if state:
+            body['state'] = [{'id': i, 'property': p, 'value': v} for i, p, v in state]
+
+        r = client.post('/_dash-update-component', data=json.dumps(body), content_type='application/json')
+
+        if r.status_code == 204:
+            continue
+
+        if r.status_code != 200:
+            raise RuntimeError('{} {} returned {}'.format(output, inputs, r.status_code))
+
+        values = [v for _, _, v in inputs + (state or [])]
+        written += write(out_dir, callback_path(output, values), r.data)
+
+    return len(batch), written
+
+
+def render_all(out_dir, items, jobs):
+
+    # Forked so the pool starts with the data already loaded
+    batches = [items[i::jobs] for i in range(jobs)]
+    context = multiprocessing.get_context('fork')
+
+    with concurrent.futures.ProcessPoolExecutor(jobs, mp_context=context) as pool:
+        results = list(pool.map(render, [out_dir] * jobs, batches))
+
+    return sum(r[0] for r in results), sum(r[1] for r in results)
+
+#################
+# Page          #
+#################
+
+def page(out_dir):
+
+    # index.html, the layout and every script it loads, with the paths made
+    # relative so the export can be served from any directory
+    client = app.server.test_client()
+    html = client.get('/').data.decode()
+
+    for path in ['_dash-layout', '_dash-dependencies']:
+        write(out_dir, path, client.get('/' + path).data)
+
+    def local(match):
+
+        url = match.group(2).split('?')[0]
+
+        if url.startswith('/_dash-component-suites/'):
+            package_path, _ = check_fingerprint(url[len('/_dash-component-suites/'):])
+            name = os.path.join('components', package_path)
+        else:
+            name = url.lstrip('/')
+
+        copy(out_dir, url, name)
+
+        return '{}="{}"'.format(match.group(1), name)
+
+    from dash.fingerprint import check_fingerprint
+
+    html = re.sub(r'(src|href)="(/[^"]*)"', local, html)
+
+    # dcc loads the graph and plotly a chunk at a time from next to its script
+    for package in ['dash_core_components']:
+        for dist in sys.modules[package]._js_dist:
+            name = dist['relative_package_path']
+
+            if not name.endswith('.map'):
+                copy(out_dir, '/_dash-component-suites/{}/{}'.format(package, name), os.path.join('components', package, name))
+
+    html = html.replace('"requests_pathname_prefix": "/"', '"requests_pathname_prefix": "./"')
+    html = html.replace('<script id="_dash-renderer"', '<script src="export.js"></script>\n            <script id="_dash-renderer"', 1)
+
+    shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'export.js'), os.path.join(out_dir, 'export.js'))
+
+    with open(os.path.join(out_dir, 'index.html'), 'w') as f:
+        f.write(html)
+
+
+def copy(out_dir, url, name):
+
+    r = app.server.test_client().get(url)
+
+    if r.status_code != 200:
+        raise RuntimeError('{} returned {}'.format(url, r.status_code))
+
+    path = os.path.join(out_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, 'wb') as f:
+        f.write(r.data)
+
+########################################################
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Export the dashboard as static files')
+    parser.add_argument('-o', '--output', default=EXPORT_DIR, help='directory to write to (replaced)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='processes rendering the views')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+
+    import app
+    import dataset
+
+    data = dataset.get()
+
+    if os.path.exists(args.output):
+        shutil.rmtree(args.output)
+
+    os.makedirs(args.output)
+
+    page(args.output)
+
+    items = views(data)
+    count, size = render_all(args.output, items, max(1, min(args.jobs, len(items))))
+
+    with open(os.path.join(args.output, 'version.json'), 'w') as f:
+        json.dump({'version': data.version, 'date': data.date}, f)
+
+    print('export: {} views, {:,} bytes to {} in {:.1f}s'.format(count, size, args.output, time.perf_counter() - start))
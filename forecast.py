@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+#
+############
+# Forecast #
+############
+#
+# Description: A short projection of daily cases and deaths for every state
+# (and the USA) at once, made when the data is loaded. Each state's 7 day
+# average over the last FORECAST_FIT days is fit with a straight line on a
+# log scale (steady growth or decline), and the line is carried on for
+# FORECAST_DAYS days. All the states are fit together from per state sums,
+# no loop over states
+#
+import os
+
+import numpy as np
+
+# Days projected, and days of history fit
+FORECAST_DAYS = int(os.environ.get('FORECAST_DAYS', 14))
+FORECAST_FIT = int(os.environ.get('FORECAST_FIT', 28))
+
+# Fewer usable days than this and the last average is carried on flat
+MIN_DAYS = 7
+
+# Fastest growth or decline projected, doubling or halving in a week
+MAX_RATE = np.log(2) / 7
+
+
+def project(cum, starts, ends, days=FORECAST_DAYS, fit=FORECAST_FIT):
+
+    # (states, days + 1) projected daily counts, from the last day in the
+    # data (the fitted value, so the line joins on) to `days` days after
+    cum = cum.astype('float64')
+    last = ends - 1
+
+    # Rows of each state's last `fit` days, earliest first
+    rows = last[:, None] - np.arange(fit - 1, -1, -1)[None, :]
+    back = rows - 7
+
+    # 7 day averages, only where the week is inside the state
+    valid = back >= starts[:, None]
+
+    avg = np.zeros(rows.shape)
+    avg[valid] = (cum[rows[valid]] - cum[back[valid]]) / 7
+
+    # log of zero days can't be fit
+    valid &= avg > 0
+
+    y = np.log(np.where(valid, avg, 1))
+    x = np.arange(fit, dtype='float64')[None, :]
+    w = valid.astype('float64')
+
+    # Least squares per state from the sums
+    n = w.sum(axis=1)
+    sx = (w * x).sum(axis=1)
+    sy = (w * y).sum(axis=1)
+    sxx = (w * x * x).sum(axis=1)
+    sxy = (w * x * y).sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+        intercept = (sy - slope * sx) / n
+
+    fitted = n >= MIN_DAYS
+
+    # Not enough days, the last average flat (0 if there's none)
+    flat = np.log(np.where(avg[:, -1] > 0, avg[:, -1], 1))
+
+    slope = np.where(fitted, np.clip(slope, -MAX_RATE, MAX_RATE), 0)
+    level = np.where(fitted, intercept + slope * (fit - 1), flat)
+
+    ahead = np.arange(days + 1, dtype='float64')[None, :]
+    out = np.exp(level[:, None] + slope[:, None] * ahead)
+
+    # Nothing in the last week stays at nothing
+    none = ~fitted & ~(avg[:, -1] > 0)
+    out[none] = 0
+
+    return np.round(out)
+
+
+def dates(last, days=FORECAST_DAYS):
+
+    # (states, days + 1) dates as strings, from each state's last day
+    ahead = last.astype('datetime64[D]')[:, None] + np.arange(days + 1)[None, :]
+
+    return np.datetime_as_string(ahead, unit='D')
+
+
+def lists(date, cases, deaths):
+
+    return {'date': date.tolist(), 'cases': cases.astype('int64').tolist(), 'deaths': deaths.astype('int64').tolist()}
+
+
+def build_forecast(table, usa_daily, days=FORECAST_DAYS, fit=FORECAST_FIT):
+
+    arrays = table.arrays
+
+    starts = arrays['starts']
+    ends = arrays['ends']
+
+    date = dates(arrays['date'][ends - 1], days)
+    cases = project(arrays['cases'], starts, ends, days, fit)
+    deaths = project(arrays['deaths'], starts, ends, days, fit)
+
+    states = {name: lists(date[i], cases[i], deaths[i]) for i, name in enumerate(table.names)}
+
+    # The USA as one more series, from its daily totals
+    one = np.array([0]), np.array([len(usa_daily)])
+
+    usa = lists(
+        dates(usa_daily.index.values[-1:], days)[0],
+        project(np.cumsum(usa_daily['cases'].values), *one, days, fit)[0],
+        project(np.cumsum(usa_daily['deaths'].values), *one, days, fit)[0])
+
+    return {'states': states, 'usa': usa}
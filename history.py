@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+#
+###########
+# History #
+###########
+#
+# Description: Every dated snapshot in data/ (us-states_MM.DD.csv) kept as
+# one base table plus a small delta per snapshot: the rows for new days and
+# the rows nytimes restated since the snapshot before. Any snapshot can be
+# rebuilt from the base and the deltas up to it ("as of"), and two snapshots
+# can be diffed to see which past numbers changed
+#
+# Snapshots are named by their last date, e.g. 2021-01-04
+#
+# Usage: python history.py build
+#        python history.py add [csv]
+#        python history.py asof 2020-12-14
+#        python history.py diff 2020-12-14 2021-01-04
+#
+import os
+import glob
+import argparse
+import functools
+
+import data_store
+
+HISTORY_STORE = os.path.join(data_store.DATA_DIR, 'us-states-history')
+
+COLUMNS = ['date', 'state', 'fips', 'cases', 'deaths']
+
+# Row kinds in a delta
+NEW = 0
+REVISED = 1
+
+#################
+# Files         #
+#################
+
+def snapshot_name(date):
+
+    return date.strftime('%Y%m%d')
+
+
+def history_files(path=HISTORY_STORE):
+
+    # base first, then the deltas in snapshot order
+    return sorted(glob.glob(os.path.join(path, 'base-*.feather'))) + sorted(glob.glob(os.path.join(path, 'delta-*.feather')))
+
+
+def snapshots(path=HISTORY_STORE):
+
+    import pandas as pd
+
+    return [pd.Timestamp(os.path.basename(p)[-16:-8]) for p in history_files(path)]
+
+
+def snapshot_files(snapshot=None, path=HISTORY_STORE):
+
+    # The base and every delta up to and including `snapshot` (default all)
+    files = history_files(path)
+
+    if snapshot is None:
+        return files
+
+    name = snapshot_name(snapshot)
+
+    return [p for p in files if os.path.basename(p)[-16:-8] <= name]
+
+#################
+# Writing       #
+#################
+
+def delta(df, known):
+
+    # Rows of snapshot df that aren't in `known`, or whose counts differ
+    df = df[COLUMNS].astype({'state': str})
+    known = known[['date', 'state', 'cases', 'deaths']].astype({'state': str})
+
+    both = df.merge(known, on=['date', 'state'], how='left', suffixes=('', '_known'), indicator=True)
+
+    new = (both['_merge'] == 'left_only').values
+    revised = ~new & ((both['cases'] != both['cases_known']) | (both['deaths'] != both['deaths_known'])).values
+
+    out = both.loc[new | revised, COLUMNS].reset_index(drop=True)
+    out['kind'] = revised[new | revised].astype('int8')
+
+    return out
+
+
+def read_snapshot(src):
+
+    df = data_store.read_csv(src)
+
+    # Same (date, state) twice in a snapshot, keep the first one
+    return df.drop_duplicates(['date', 'state']).sort_values(['date', 'state'], kind='mergesort')
+
+
+def add(src=None, path=HISTORY_STORE):
+
+    # Append a snapshot's delta against the latest one stored
+    if src is None:
+        src = data_store.latest_snapshot()
+
+    df = read_snapshot(src)
+    name = snapshot_name(df['date'].max())
+
+    os.makedirs(path, exist_ok=True)
+
+    if not history_files(path):
+        data_store.write_store(df.astype({'state': str}), os.path.join(path, 'base-{}.feather'.format(name)))
+        return df
+
+    last = snapshots(path)[-1]
+
+    if df['date'].max() <= last:
+        raise ValueError('snapshot {} is not newer than {}'.format(name, snapshot_name(last)))
+
+    out = delta(df, as_of(last, path))
+    data_store.write_store(out, os.path.join(path, 'delta-{}.feather'.format(name)))
+
+    as_of.cache_clear()
+
+    return out
+
+
+def build(files=None, path=HISTORY_STORE):
+
+    # Rebuild from every dated snapshot in data/, oldest first
+    if files is None:
+        files = glob.glob(os.path.join(data_store.DATA_DIR, 'us-states_*.csv'))
+
+    for p in history_files(path):
+        os.remove(p)
+
+    as_of.cache_clear()
+
+    for src in sorted(files, key=data_store.last_line_date):
+        add(src, path)
+
+#################
+# Queries       #
+#################
+
+@functools.lru_cache(maxsize=4)
+def as_of(snapshot=None, path=HISTORY_STORE):
+
+    # The data as it was published in `snapshot` (default the latest),
+    # later rows for the same (date, state) replace earlier ones
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    files = snapshot_files(snapshot, path)
+
+    if not files:
+        return None
+
+    tables = [feather.read_table(p, columns=COLUMNS, memory_map=True) for p in files]
+    df = pa.concat_tables(tables).to_pandas()
+
+    df = df.drop_duplicates(['date', 'state'], keep='last')
+    df = df.sort_values(['date', 'state'], kind='mergesort').reset_index(drop=True)
+
+    df['state'] = df['state'].astype('category')
+
+    return df
+
+
+def revisions(start, end=None, path=HISTORY_STORE):
+
+    # Past days restated after snapshot `start` up to `end`, with the counts
+    # as of `start` next to the ones as of `end`
+    import pandas as pd
+
+    files = [p for p in snapshot_files(end, path) if os.path.basename(p)[-16:-8] > snapshot_name(start)]
+
+    if not files:
+        return None
+
+    changed = pd.concat([data_store.read_store(p) for p in files], ignore_index=True)
+    changed = changed[(changed['kind'] == REVISED) & (changed['date'] <= start)]
+    changed = changed.drop_duplicates(['date', 'state'], keep='last')
+
+    before = as_of(start, path)[['date', 'state', 'cases', 'deaths']].astype({'state': str})
+
+    out = changed[['date', 'state', 'cases', 'deaths']].merge(before, on=['date', 'state'], suffixes=('', '_before'))
+
+    out['cases_change'] = out['cases'] - out['cases_before']
+    out['deaths_change'] = out['deaths'] - out['deaths_before']
+
+    return out.sort_values(['state', 'date'], kind='mergesort').reset_index(drop=True)
+
+########################################################
+
+if __name__ == '__main__':
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description='Snapshot history store')
+    parser.add_argument('command', choices=['build', 'add', 'asof', 'diff'])
+    parser.add_argument('args', nargs='*', help='csv for add, snapshot dates for asof and diff')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build()
+
+        files = history_files()
+        size = sum(os.path.getsize(p) for p in files)
+
+        print('history: {} snapshots, {:,} bytes'.format(len(files), size))
+
+    elif args.command == 'add':
+        out = add(args.args[0] if args.args else None)
+        print('history: added {:,} rows'.format(len(out)))
+
+    elif args.command == 'asof':
+        df = as_of(pd.Timestamp(args.args[0]) if args.args else None)
+        print(df.tail(len(df['state'].cat.categories)).to_string(index=False))
+
+    else:
+        start = pd.Timestamp(args.args[0])
+        end = pd.Timestamp(args.args[1]) if len(args.args) > 1 else None
+
+        df = revisions(start, end)
+
+        if df is None or not len(df):
+            print('no revisions')
+        else:
+            print(df.to_string(index=False))
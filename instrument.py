@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+#
+###################
+# Instrumentation #
+###################
+#
+# Description: Latency histograms and response sizes for every dash callback,
+# timings for the data load, cache hit and miss counts and the data version,
+# served in the prometheus text format at /metrics. Each gunicorn worker
+# keeps its own numbers (the pid label tells them apart)
+#
+# Recording is a lock and a few additions per request, cheap enough to leave on
+#
+import os
+import time
+import bisect
+import logging
+import threading
+import contextlib
+
+import flask
+
+log = logging.getLogger(__name__)
+
+# Log callbacks slower than this many ms with their inputs, 0 turns it off
+SLOW_CALLBACK_MS = float(os.environ.get('SLOW_CALLBACK_MS', 0))
+
+# Histogram buckets in seconds
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=BUCKETS):
+
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+
+        out = []
+        total = 0
+
+        for le, n in zip(self.buckets + ['+Inf'], self.counts):
+            total += n
+            out.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, le, total))
+
+        out.append('{}_sum{{{}}} {}'.format(name, labels, self.sum))
+        out.append('{}_count{{{}}} {}'.format(name, labels, self.count))
+
+        return out
+
+#################
+# Registry      #
+#################
+
+_lock = threading.Lock()
+
+callbacks = {}       # callback name -> latency Histogram
+response_bytes = {}  # callback name -> total bytes sent
+timings = {}         # e.g. data_load -> Histogram
+
+# name -> function returning {label value: number}, read at scrape time
+gauges = {}
+
+
+def observe_callback(name, seconds, size):
+
+    with _lock:
+        if name not in callbacks:
+            callbacks[name] = Histogram()
+            response_bytes[name] = 0
+
+        callbacks[name].observe(seconds)
+        response_bytes[name] += size
+
+
+@contextlib.contextmanager
+def timer(name):
+
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+
+        with _lock:
+            timings.setdefault(name, Histogram()).observe(elapsed)
+
+#################
+# Flask hooks   #
+#################
+
+def install(app, prewarm_header=None):
+
+    server = app.server
+
+    # Runs before the response cache so cached answers are timed too
+    @server.before_request
+    def start_timer():
+
+        if flask.request.path == '/_dash-update-component' and prewarm_header not in flask.request.headers:
+            flask.g.callback_start = time.perf_counter()
+
+    def record(response):
+
+        start = flask.g.pop('callback_start', None)
+
+        if start is None:
+            return response
+
+        elapsed = time.perf_counter() - start
+
+        body = flask.request.get_json(silent=True) or {}
+        output = body.get('output', '')
+
+        # Label by the callback's function name, e.g. update_state
+        callback = app.callback_map.get(output, {}).get('callback')
+        name = getattr(callback, '__name__', output)
+
+        size = response.calculate_content_length() or 0
+
+        observe_callback(name, elapsed, size)
+
+        if SLOW_CALLBACK_MS and elapsed * 1000 > SLOW_CALLBACK_MS:
+            inputs = {'{}.{}'.format(i.get('id'), i.get('property')): i.get('value')
+                      for i in body.get('inputs', []) + body.get('state', [])}
+            log.warning('slow callback %s: %.1f ms, %d bytes, inputs %s', name, elapsed * 1000, size, inputs)
+
+        return response
+
+    # Flask runs the after request hooks last registered first, so this one
+    # goes to the front of the list to run after flask-compress (registered
+    # by dash) and count the bytes actually sent
+    server.after_request_funcs.setdefault(None, []).insert(0, record)
+
+    @server.route('/metrics')
+    def metrics_endpoint():
+
+        return flask.Response('\n'.join(render()) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def render():
+
+    pid = 'pid="{}"'.format(os.getpid())
+    out = []
+
+    with _lock:
+        out.append('# HELP c19_callback_seconds Dash callback latency')
+        out.append('# TYPE c19_callback_seconds histogram')
+
+        for name, h in sorted(callbacks.items()):
+            out += h.lines('c19_callback_seconds', '{},callback="{}"'.format(pid, name))
+
+        out.append('# HELP c19_callback_response_bytes_total Bytes sent by dash callbacks')
+        out.append('# TYPE c19_callback_response_bytes_total counter')
+
+        for name, n in sorted(response_bytes.items()):
+            out.append('c19_callback_response_bytes_total{{{},callback="{}"}} {}'.format(pid, name, n))
+
+        out.append('# HELP c19_timing_seconds Data load and refresh timings')
+        out.append('# TYPE c19_timing_seconds histogram')
+
+        for name, h in sorted(timings.items()):
+            out += h.lines('c19_timing_seconds', '{},step="{}"'.format(pid, name))
+
+    for metric, (help_text, fn) in sorted(gauges.items()):
+        out.append('# HELP {} {}'.format(metric, help_text))
+        out.append('# TYPE {} gauge'.format(metric))
+
+        for labels, value in sorted(fn().items()):
+            extra = ',' + labels if labels else ''
+            out.append('{}{{{}{}}} {}'.format(metric, pid, extra, value))
+
+    return out
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+#
+#############
+# Load test #
+#############
+#
+# Description: Starts gunicorn serving app:server on a local port against the
+# data already in data/ (no refresh, nothing fetched from github) and has a
+# number of simulated users click through the dashboard at once, the same
+# _dash-update-component requests a browser sends: opening the USA tab and
+# switching the map view, picking states and counties on the state tab,
+# zooming, and comparing states. Each level of concurrency runs for a while
+# and the throughput, latency percentiles and errors for every callback are
+# reported. Results are written as json so worker counts, worker classes and
+# the response cache can be compared
+#
+# The graph radio buttons (cases, deaths, both) are drawn in the browser
+# (assets/graphs.js) and never reach the server, so only the map view radio
+# is part of the traffic
+#
+# Usage: python loadtest.py [--workers 1] [--worker-class gthread --threads 4]
+#                           [--cache 0] [--concurrency 1,4,16,32] [--duration 20]
+#                           [-o results.json] [--compare old.json]
+#        python loadtest.py --url http://127.0.0.1:8050   (a server already running)
+#
+import os
+import csv
+import json
+import time
+import random
+import socket
+import argparse
+import platform
+import threading
+import subprocess
+
+import requests
+
+import cache
+
+# Callback output ids (as in app.py)
+STATE_OUTPUTS = '..state-series.data...total_cases.children..'
+COUNTY_OPTIONS = '..county-dropdown.options...county-dropdown.value..'
+COUNTY_OUTPUTS = '..county-series.data...county-table.children..'
+COMPARE_OUTPUTS = '..compare-series.data...compare-table.children..'
+
+# Callback for each output, to report by name
+CALLBACKS = {
+    'tabs-content.children': 'render_content',
+    'usa-map.figure': 'update_map',
+    STATE_OUTPUTS: 'update_state',
+    'state-zoom.data': 'update_state_zoom',
+    COUNTY_OPTIONS: 'update_county_options',
+    COUNTY_OUTPUTS: 'update_county',
+    COMPARE_OUTPUTS: 'update_compare',
+}
+
+# What the page starts with
+DEFAULT_STATE = 'Massachusetts'
+DEFAULT_COMPARE = ['California', 'Florida', 'New York', 'Texas']
+
+#################
+# Server        #
+#################
+
+def free_port():
+
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, workers, worker_class, threads, figure_cache, preload=False):
+
+    # Only the local data, and no refresh while the test runs
+    env = dict(os.environ, REFRESH_INTERVAL='0', FIGURE_CACHE=figure_cache)
+    env.pop('REFRESH_REMOTE', None)
+
+    command = ['gunicorn', 'app:server',
+            '--bind', '127.0.0.1:{}'.format(port),
+            '--workers', str(workers),
+            '--worker-class', worker_class,
+            '--threads', str(threads),
+            '--log-level', 'warning']
+
+    if preload:
+        command.append('--preload')
+
+    return subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+
+
+def wait_ready(url, server=None, timeout=120):
+
+    deadline = time.time() + timeout
+
+    while time.time() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError('gunicorn exited with {}'.format(server.returncode))
+
+        try:
+            if requests.get(url + '/ready', timeout=5).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+
+        time.sleep(0.5)
+
+    raise RuntimeError('{} not ready after {}s'.format(url, timeout))
+
+
+def stop_server(server):
+
+    server.terminate()
+
+    try:
+        server.wait(30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def state_names(url):
+
+    # Every state, from the data api
+    r = requests.get(url + '/api/states/metrics', timeout=30)
+    r.raise_for_status()
+
+    rows = list(csv.reader(r.text.splitlines()))
+
+    return [row[0] for row in rows[1:]]
+
+#################
+# Users         #
+#################
+
+def post(session, url, output, inputs, state=None, records=None):
+
+    body = cache.callback_body(output, inputs)
+
+    if state:
+        body['state'] = [{'id': i, 'property': p, 'value': v} for i, p, v in state]
+
+    start = time.perf_counter()
+
+    try:
+        r = session.post(url + '/_dash-update-component', data=json.dumps(body),
+                headers={'Content-Type': 'application/json'}, timeout=60)
+        status, content = r.status_code, r.content
+        size = int(r.headers.get('Content-Length', len(content)))
+    except requests.RequestException:
+        status, content, size = 0, b'', 0
+
+    # (callback, time sent, ms, status, bytes)
+    records.append((CALLBACKS[output], start, (time.perf_counter() - start) * 1000, status, size))
+
+    # 204 is dash's PreventUpdate
+    if status == 200:
+        return json.loads(content)['response']
+
+    return None
+
+
+def visit(session, url, states, rng, records):
+
+    # One page view: the USA tab, then a few states, then maybe a comparison
+    post(session, url, 'tabs-content.children', [('tabs', 'value', 'tab-1')], records=records)
+    post(session, url, 'usa-map.figure', [('map_view', 'value', 'cases')], records=records)
+
+    if rng.random() < 0.4:
+        post(session, url, 'usa-map.figure', [('map_view', 'value', 'per-100k')], records=records)
+
+    post(session, url, 'tabs-content.children', [('tabs', 'value', 'tab-2')], records=records)
+
+    for n in range(rng.randint(1, 5)):
+        state = DEFAULT_STATE if n == 0 else rng.choice(states)
+
+        post(session, url, STATE_OUTPUTS, [('my-dropdown2', 'value', state)], records=records)
+        options = post(session, url, COUNTY_OPTIONS, [('my-dropdown2', 'value', state)], records=records)
+
+        county = options and options['county-dropdown']['value']
+
+        if county:
+            post(session, url, COUNTY_OUTPUTS, [('county-dropdown', 'value', county)],
+                    state=[('my-dropdown2', 'value', state)], records=records)
+
+        # Zooming into a few months of graph_1
+        if rng.random() < 0.2:
+            start = '2020-{:02d}-01'.format(rng.randint(3, 9))
+            end = '2020-{:02d}-01'.format(int(start[5:7]) + 3)
+
+            post(session, url, 'state-zoom.data', [('graph_1', 'relayoutData', {'xaxis.range[0]': start, 'xaxis.range[1]': end})],
+                    state=[('my-dropdown2', 'value', state)], records=records)
+
+    if rng.random() < 0.3:
+        post(session, url, 'tabs-content.children', [('tabs', 'value', 'tab-3')], records=records)
+
+        selection = [s for s in DEFAULT_COMPARE if s in states]
+        post(session, url, COMPARE_OUTPUTS, [('compare-dropdown', 'value', selection)], records=records)
+
+        for _ in range(rng.randint(1, 3)):
+            selection = selection + [rng.choice(states)]
+            post(session, url, COMPARE_OUTPUTS, [('compare-dropdown', 'value', selection)], records=records)
+
+
+def user(url, states, seed, stop, think, records):
+
+    rng = random.Random(seed)
+    session = requests.Session()
+
+    # Browsers ask for compressed responses
+    session.headers['Accept-Encoding'] = 'gzip, deflate, br'
+
+    while not stop.is_set():
+        visit(session, url, states, rng, records)
+
+        if think:
+            stop.wait(rng.expovariate(1 / think))
+
+
+def run(url, states, concurrency, duration, warmup, think, seed=0):
+
+    # `concurrency` users clicking through for warmup + duration seconds,
+    # only requests sent after the warmup are counted
+    stop = threading.Event()
+    records = [[] for _ in range(concurrency)]
+
+    threads = [threading.Thread(target=user, args=(url, states, seed + i, stop, think, records[i]), daemon=True)
+            for i in range(concurrency)]
+
+    start = time.perf_counter()
+
+    for t in threads:
+        t.start()
+
+    time.sleep(warmup + duration)
+    stop.set()
+
+    for t in threads:
+        t.join()
+
+    begin, end = start + warmup, start + warmup + duration
+
+    return [r for rs in records for r in rs if begin <= r[1] < end], duration
+
+#################
+# Results       #
+#################
+
+def percentile(times, q):
+
+    return times[min(len(times) - 1, int(len(times) * q))]
+
+
+def summarize(records, duration):
+
+    times = sorted(r[2] for r in records)
+    errors = sum(1 for r in records if r[3] not in (200, 204))
+
+    if not times:
+        return {'n': 0, 'rps': 0.0, 'errors': 0, 'error_rate': 0.0}
+
+    return {
+        'n': len(times),
+        'rps': round(len(times) / duration, 2),
+        'p50_ms': round(percentile(times, 0.50), 3),
+        'p95_ms': round(percentile(times, 0.95), 3),
+        'p99_ms': round(percentile(times, 0.99), 3),
+        'max_ms': round(times[-1], 3),
+        'errors': errors,
+        'error_rate': round(errors / len(times), 4),
+        'mean_bytes': int(sum(r[4] for r in records) / len(records)),
+    }
+
+
+def by_callback(records, duration, prefix):
+
+    results = {prefix + '.all': summarize(records, duration)}
+
+    for name in sorted(set(r[0] for r in records)):
+        results['{}.{}'.format(prefix, name)] = summarize([r for r in records if r[0] == name], duration)
+
+    return results
+
+
+def report(results):
+
+    print('{:<36} {:>7} {:>8} {:>9} {:>9} {:>9} {:>7}'.format('callback', 'n', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+
+    for name, r in results.items():
+        if not r['n']:
+            continue
+
+        print('{:<36} {:>7} {:>8.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>6.1%}'.format(
+            name, r['n'], r['rps'], r['p50_ms'], r['p95_ms'], r['p99_ms'], r['error_rate']))
+
+
+def compare(results, old):
+
+    print('{:<36} {:>9} {:>9} {:>10} {:>10}'.format('callback', 'old req/s', 'new req/s', 'old p95 ms', 'new p95 ms'))
+
+    for name, new in results.items():
+        if name not in old or not new['n'] or not old[name]['n']:
+            continue
+
+        print('{:<36} {:>9.1f} {:>9.1f} {:>10.1f} {:>10.1f}'.format(name, old[name]['rps'], new['rps'], old[name]['p95_ms'], new['p95_ms']))
+
+########################################################
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Load test the dash callbacks under gunicorn')
+    parser.add_argument('--url', help='test a server that is already running instead of starting gunicorn')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--worker-class', default='sync', choices=['sync', 'gthread'])
+    parser.add_argument('--threads', type=int, default=1, help='threads per worker (gthread)')
+    parser.add_argument('--preload', action='store_true', help='start gunicorn with --preload')
+    parser.add_argument('--cache', default='1', choices=['0', '1'], help='response cache on or off (FIGURE_CACHE)')
+    parser.add_argument('--concurrency', default='1,4,16,32', help='simulated users, comma separated to step through several')
+    parser.add_argument('--duration', type=float, default=20, help='seconds counted at each concurrency')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds run first and not counted')
+    parser.add_argument('--think', type=float, default=0, help='mean seconds a user waits between page views')
+    parser.add_argument('-o', '--output', help='write the results to this json file')
+    parser.add_argument('--compare', help='json results from an earlier run to compare with')
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+
+    if url is None:
+        url = 'http://127.0.0.1:{}'.format(free_port())
+        server = start_server(url.rsplit(':', 1)[1], args.workers, args.worker_class, args.threads, args.cache, args.preload)
+
+    try:
+        wait_ready(url, server)
+        states = state_names(url)
+
+        results = {}
+
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            records, duration = run(url, states, concurrency, args.duration, args.warmup, args.think)
+            results.update(by_callback(records, duration, 'c{}'.format(concurrency)))
+
+            print('{} users: {:.1f} req/s'.format(concurrency, results['c{}.all'.format(concurrency)]['rps']))
+    finally:
+        if server is not None:
+            stop_server(server)
+
+    out = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'url': args.url,
+            'workers': args.workers,
+            'worker_class': args.worker_class,
+            'threads': args.threads,
+            'preload': args.preload,
+            'figure_cache': args.cache,
+            'duration': args.duration,
+            'think': args.think,
+        },
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(out, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)['results'])
+    else:
+        report(results)
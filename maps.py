@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+#
+########
+# Maps #
+########
+#
+# Description: Builds the choropleth of the USA tab once per data version as
+# a small plain figure dict (no plotly template, rounded numbers) and serves
+# the serialized json from the flask server with an ETag
+#
+import flask
+
+import data_store
+import transport
+
+#state Codes
+us_state_abbrev = {
+    'Alabama': 'AL',
+    'Alaska': 'AK',
+    'American Samoa': 'AS',
+    'Arizona': 'AZ',
+    'Arkansas': 'AR',
+    'California': 'CA',
+    'Colorado': 'CO',
+    'Connecticut': 'CT',
+    'Delaware': 'DE',
+    'District of Columbia': 'DC',
+    'Florida': 'FL',
+    'Georgia': 'GA',
+    'Guam': 'GU',
+    'Hawaii': 'HI',
+    'Idaho': 'ID',
+    'Illinois': 'IL',
+    'Indiana': 'IN',
+    'Iowa': 'IA',
+    'Kansas': 'KS',
+    'Kentucky': 'KY',
+    'Louisiana': 'LA',
+    'Maine': 'ME',
+    'Maryland': 'MD',
+    'Massachusetts': 'MA',
+    'Michigan': 'MI',
+    'Minnesota': 'MN',
+    'Mississippi': 'MS',
+    'Missouri': 'MO',
+    'Montana': 'MT',
+    'Nebraska': 'NE',
+    'Nevada': 'NV',
+    'New Hampshire': 'NH',
+    'New Jersey': 'NJ',
+    'New Mexico': 'NM',
+    'New York': 'NY',
+    'North Carolina': 'NC',
+    'North Dakota': 'ND',
+    'Northern Mariana Islands':'MP',
+    'Ohio': 'OH',
+    'Oklahoma': 'OK',
+    'Oregon': 'OR',
+    'Pennsylvania': 'PA',
+    'Puerto Rico': 'PR',
+    'Rhode Island': 'RI',
+    'South Carolina': 'SC',
+    'South Dakota': 'SD',
+    'Tennessee': 'TN',
+    'Texas': 'TX',
+    'Utah': 'UT',
+    'Vermont': 'VT',
+    'Virgin Islands': 'VI',
+    'Virginia': 'VA',
+    'Washington': 'WA',
+    'West Virginia': 'WV',
+    'Wisconsin': 'WI',
+    'Wyoming': 'WY'
+}
+
+# Map views, title and color range for each
+VIEWS = {
+    'cases': ('Cases per State', [0, 1000000]),
+    'per-100k': ('Cases per 100k People', None),
+}
+
+# Plasma, the plotly express default
+COLORSCALE = [
+    [0.0, '#0d0887'], [0.111, '#46039f'], [0.222, '#7201a8'], [0.333, '#9c179e'],
+    [0.444, '#bd3786'], [0.556, '#d8576b'], [0.667, '#ed7953'], [0.778, '#fb9f3a'],
+    [0.889, '#fdca26'], [1.0, '#f0f921'],
+]
+
+
+def state_totals(arrays):
+
+    # County Data, only the last date is read from the store
+    df = data_store.load_latest_counties(columns=['date', 'state', 'cases'])
+
+    if df is not None:
+        df = df.groupby(df['state'].astype(str))['cases'].sum()
+
+    # Fall back to the state totals when the county store hasn't been built
+    else:
+        import metrics
+        df = metrics.latest_totals(arrays)
+
+    return df
+
+
+def build_figure(totals, view):
+
+    title, color_range = VIEWS[view]
+
+    if view == 'per-100k':
+        population = data_store.load_population().reindex(totals.index)
+        values = (totals / population * 100000).round(1)
+        label = 'per 100k'
+    else:
+        values = totals
+        label = 'cases'
+
+    values = values.dropna()
+    locations = [us_state_abbrev.get(s, s) for s in values.index]
+
+    trace = {
+        'type': 'choropleth',
+        'locationmode': 'USA-states',
+        'locations': locations,
+        'z': values.tolist(),
+        'coloraxis': 'coloraxis',
+        'hovertemplate': 'state=%{location}<br>' + label + '=%{z}<extra></extra>',
+    }
+
+    coloraxis = {'colorscale': COLORSCALE, 'colorbar': {'title': {'text': label}}}
+
+    if color_range is not None:
+        coloraxis['cmin'], coloraxis['cmax'] = color_range
+
+    return {
+        'data': [trace],
+        'layout': {
+            'title': {'text': title},
+            'geo': {'scope': 'usa'},
+            'coloraxis': coloraxis,
+            'margin': {'l': 0, 'r': 0, 'b': 0},
+        },
+    }
+
+
+def build_maps(arrays):
+
+    totals = state_totals(arrays)
+
+    # Sorted by abbreviation like the old plotly express map
+    totals.index = totals.index.astype(str)
+    totals = totals.sort_index(key=lambda i: i.map(lambda s: us_state_abbrev.get(s, s)))
+
+    figures = {view: build_figure(totals, view) for view in VIEWS}
+
+    blobs = {view: transport.dumps(f) for view, f in figures.items()}
+
+    return figures, blobs
+
+
+def install(server, get_data, max_age=300):
+
+    @server.route('/map/<view>.json')
+    def map_json(view):
+
+        data = get_data()
+
+        if view not in data.map_json:
+            flask.abort(404)
+
+        response = flask.Response(data.map_json[view], mimetype='application/json')
+        response.set_etag('{}-{}'.format(data.version, view))
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+
+        return response.make_conditional(flask.request)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+#
+###########
+# Metrics #
+###########
+#
+# Description: Computes the per state series and summary numbers the state tab
+# shows, for every state at once, so the callbacks only have to look them up
+#
+# Everything is built from `arrays`: the state data as flat numpy columns
+# sorted by (state, date), plus the row range of each state. The same dict
+# can come from state_arrays() or be attached from shared memory (shared.py),
+# and query.StateTable looks states up in it
+#
+import numpy as np
+import pandas as pd
+
+import clean
+import data_store
+import downsample
+
+# Summary columns, each one exists for cases and deaths
+# e.g. cases_total, deaths_average_5
+SUMMARY = ['total', 'average', 'average_5', 'average_30', 'change_5', 'change_30']
+
+# Row level columns in `arrays`, state is an integer code into names.
+# cases and deaths are the corrected cumulative counts, raw_ the ones in the
+# data and flags says what was corrected on each row (see clean.py)
+COLUMNS = ['state', 'date', 'cases', 'deaths', 'new_cases', 'new_deaths', 'raw_cases', 'raw_deaths', 'flags']
+
+
+def state_offsets(df, key='state'):
+
+    # df is sorted by (key, date), find where each key's rows start and end
+    state = df[key].astype(str).values
+
+    starts = np.flatnonzero(np.r_[True, state[1:] != state[:-1]])
+    ends = np.r_[starts[1:], len(state)]
+
+    return state[starts], starts, ends
+
+
+def state_arrays(df_states, key='state', revisions=None):
+
+    # key='county' builds the same arrays for a county partition
+    df = df_states.sort_values([key, 'date'], kind='mergesort').reset_index(drop=True)
+
+    # Cleaned once here so nothing downstream has to (see clean.py)
+    df, flags = clean.dedupe(df, key)
+    df, flags = clean.revise(df, flags, revisions, key)
+
+    names, starts, ends = state_offsets(df, key)
+
+    dates, starts, ends, (raw_cases, raw_deaths), flags = clean.fill_gaps(
+            df['date'].values.astype('datetime64[ns]'), starts, ends,
+            [df['cases'].values.astype('int64'), df['deaths'].values.astype('int64')], flags)
+
+    cases, negative_cases = clean.correct(raw_cases, starts, ends)
+    deaths, negative_deaths = clean.correct(raw_deaths, starts, ends)
+
+    flags = flags | np.where(negative_cases | negative_deaths, clean.NEGATIVE, 0).astype('uint8')
+
+    # Daily changes, the first day of each state has nothing to diff against
+    def daily(cum):
+        new = np.empty(len(cum))
+        new[0] = np.nan
+        new[1:] = np.diff(cum)
+        new[starts] = np.nan
+        return new
+
+    codes = np.repeat(np.arange(len(names), dtype='int16'), ends - starts)
+
+    return {
+        'version': data_store.data_version(df_states, revisions),
+        'names': list(names),
+        'starts': starts,
+        'ends': ends,
+        'state': codes,
+        'date': dates,
+        'cases': cases,
+        'deaths': deaths,
+        'new_cases': daily(cases),
+        'new_deaths': daily(deaths),
+        'raw_cases': raw_cases,
+        'raw_deaths': raw_deaths,
+        'flags': flags,
+    }
+
+
+def to_list(values):
+
+    # missing days as null
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def graph_series(table, name, rows, points, tail=5):
+
+    # A state's daily series for the graphs, thinned to about `points` days
+    # (see downsample.py) with the last `tail` days (graph_2) all kept
+    arrays = table.arrays
+
+    cases = arrays['new_cases'][rows]
+    deaths = arrays['new_deaths'][rows]
+    dates = arrays['date'][rows]
+
+    keep = downsample.thin([cases, deaths], points, tail)
+
+    return {
+        'name': name,
+        'date': np.datetime_as_string(dates[keep], unit='D').tolist(),
+        'cases': to_list(cases[keep]),
+        'deaths': to_list(deaths[keep]),
+    }
+
+
+def zoom_series(table, name, start, end, points=downsample.GRAPH_POINTS):
+
+    # The days between start and end (dates from a plotly relayout, which can
+    # have a time on them), at full resolution unless there are too many
+    rows = table.rows(name)
+    dates = table.arrays['date'][rows]
+
+    a = np.searchsorted(dates, np.datetime64(start[:10], 'ns'))
+    b = np.searchsorted(dates, np.datetime64(end[:10], 'ns'), side='right')
+
+    return graph_series(table, name, slice(rows.start + a, rows.start + b), points, tail=0)
+
+
+def build_state_metrics(table, points=downsample.GRAPH_POINTS):
+
+    arrays = table.arrays
+
+    starts = arrays['starts']
+    ends = arrays['ends']
+
+    # (rows, 2) array of cumulative cases and deaths
+    cum = np.column_stack([arrays['cases'], arrays['deaths']]).astype('float64')
+
+    # Summary numbers, computed from the cumulative columns per state
+    n = ends - starts
+    last = cum[ends - 1]
+
+    def back(k):
+        # cumulative value k rows from the end (k=1 is the last row)
+        vals = cum[np.maximum(ends - k, starts)]
+        return np.where((n >= k)[:, None], vals, np.nan)
+
+    def average(k):
+        # mean of the last k daily changes, or all of them if there are fewer
+        m = np.minimum(k, n - 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (last - cum[ends - 1 - m]) / m[:, None]
+
+    def change(k):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (last - back(k)) / back(k) * 100
+
+    values = {
+        'total': last,
+        'average': np.round(average(n - 1)),
+        'average_5': np.round(average(5)),
+        'average_30': np.round(average(30)),
+        'change_5': np.round(change(5), 2),
+        'change_30': np.round(change(30), 2),
+    }
+
+    summary = {}
+
+    for i, name in enumerate(arrays['names']):
+        row = {}
+
+        for key in SUMMARY:
+            row['cases_' + key] = values[key][i, 0]
+            row['deaths_' + key] = values[key][i, 1]
+
+        row['cases_total'] = int(row['cases_total'])
+        row['deaths_total'] = int(row['deaths_total'])
+
+        summary[name] = row
+
+    # Per state daily series for the graphs, as plain lists sent to the browser
+    series = {}
+
+    for name in table.names:
+        series[name] = graph_series(table, name, table.rows(name), points)
+
+    return {'states': table.states(), 'summary': summary, 'series': series}
+
+
+def compare_series(table, names, points=None):
+
+    # Daily series of several states for the comparison graph, from one
+    # batched query, at most `points` days each (see StateTable.take)
+    columns, bounds = table.take(names, ['date', 'new_cases', 'new_deaths'], points)
+
+    dates = np.datetime_as_string(columns['date'], unit='D').tolist()
+    cases = to_list(columns['new_cases'])
+    deaths = to_list(columns['new_deaths'])
+
+    return [
+        {'name': name, 'date': dates[a:b], 'cases': cases[a:b], 'deaths': deaths[a:b]}
+        for name, a, b in zip(names, bounds[:-1], bounds[1:])
+        ]
+
+
+def build_usa_metrics(arrays, points=downsample.GRAPH_POINTS):
+
+    # National totals per day
+    dates, day = np.unique(arrays['date'], return_inverse=True)
+
+    usa = pd.DataFrame({
+        'cases': np.bincount(day, weights=arrays['cases']).astype('int64'),
+        'deaths': np.bincount(day, weights=arrays['deaths']).astype('int64'),
+    }, index=pd.DatetimeIndex(dates, name='date'))
+
+    last = usa.iloc[-1]
+    back = usa.iloc[-5]
+
+    # % change over the last 5 days
+    change = (last - back) / back * 100
+
+    # Daily changes for the graphs
+    daily = usa.diff().fillna(0)
+
+    # Plain lists for the graphs, the full history thinned out
+    # and the last 5 days
+    def lists(df):
+        return {
+            'date': np.datetime_as_string(df.index.values, unit='D').tolist(),
+            'cases': df['cases'].values.astype('int64').tolist(),
+            'deaths': df['deaths'].values.astype('int64').tolist(),
+        }
+
+    keep = downsample.thin([daily['cases'].values, daily['deaths'].values], points)
+
+    return {
+        'cases_total': int(last['cases']),
+        'deaths_total': int(last['deaths']),
+        'cases_change_5': round(change['cases'], 2),
+        'deaths_change_5': round(change['deaths'], 2),
+        'daily': daily,
+        'graph': lists(daily.iloc[keep]),
+        'recent': lists(daily.tail()),
+    }
+
+
+def latest_totals(arrays):
+
+    # Cases per state on the last date in the data
+    last = arrays['ends'] - 1
+    keep = arrays['date'][last] == arrays['date'].max()
+
+    names = np.asarray(arrays['names'])[keep]
+
+    return pd.Series(arrays['cases'][last][keep], index=pd.Index(names, name='state'), name='cases')
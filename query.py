@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+#
+#########
+# Query #
+#########
+#
+# Description: Small query api over the state arrays (see metrics.py). Rows
+# are sorted by (state, date) so each state is one contiguous row range, and
+# looking a state up is a dict lookup plus numpy slices that share memory
+# with the arrays instead of a scan over every row
+#
+import numpy as np
+
+
+class StateTable(object):
+
+    def __init__(self, arrays):
+
+        self.arrays = arrays
+        self.names = list(arrays['names'])
+
+        # state name -> integer code, the code is the position in names
+        self.codes = {name: i for i, name in enumerate(self.names)}
+
+        # offsets table, code -> (start, end) row range
+        self.offsets = np.column_stack([arrays['starts'], arrays['ends']])
+
+    def __contains__(self, name):
+
+        return name in self.codes
+
+    def __len__(self):
+
+        return len(self.names)
+
+    def states(self):
+
+        return sorted(self.names)
+
+    def rows(self, name):
+
+        start, end = self.offsets[self.codes[name]]
+
+        return slice(start, end)
+
+    def codes_for(self, names):
+
+        return np.array([self.codes[n] for n in names], dtype='int64')
+
+    def take(self, names, columns=('date', 'new_cases', 'new_deaths'), points=None):
+
+        # Several states in one gather instead of one slice per state, keeping
+        # at most `points` evenly spaced rows of each (always the last one).
+        # Returns the columns and bounds, state i is rows bounds[i]:bounds[i + 1]
+        codes = self.codes_for(names)
+
+        if not len(codes):
+            return {c: self.arrays[c][:0] for c in columns}, np.zeros(1, dtype='int64')
+
+        starts, ends = self.offsets[codes].T
+
+        lengths = ends - starts
+        step = np.ones(len(codes), dtype='int64')
+
+        if points:
+            step = np.maximum(-(-lengths // points), 1)
+
+        # position of every row within its state
+        first = np.r_[0, np.cumsum(lengths)[:-1]]
+        pos = np.arange(lengths.sum()) - np.repeat(first, lengths)
+
+        keep = (pos % np.repeat(step, lengths) == 0) | (pos == np.repeat(lengths - 1, lengths))
+        rows = (np.repeat(starts, lengths) + pos)[keep]
+
+        counts = np.add.reduceat(keep.astype('int64'), first)
+        bounds = np.r_[0, np.cumsum(counts)]
+
+        return {c: self.arrays[c][rows] for c in columns}, bounds
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+#
+###############
+# Shared Data #
+###############
+#
+# Description: Lets gunicorn workers share one copy of the state arrays.
+# The first worker to get the lock publishes the arrays (see metrics.py) as
+# an uncompressed arrow file, every worker then memory maps that file and
+# uses numpy views straight into it, so the pages live once in the OS page
+# cache instead of once per worker
+#
+# Usage: python shared.py    (publish ahead of time, e.g. before gunicorn starts)
+#
+import os
+import json
+import glob
+import fcntl
+import hashlib
+
+import numpy as np
+import pyarrow as pa
+
+import data_store
+import metrics
+
+SHARED_DIR = os.path.join(data_store.DATA_DIR, 'shared')
+
+LOCK_FILE = os.path.join(SHARED_DIR, '.publish.lock')
+
+
+def shared_path(parts):
+
+    # One file per set of store parts (and columns), named after their
+    # names, mtimes and sizes since a rebuild reuses the names
+    names = ['{}:{}:{}'.format(*k) for k in data_store.store_key(parts)] + metrics.COLUMNS
+    key = hashlib.sha1('\n'.join(names).encode()).hexdigest()[:12]
+
+    return os.path.join(SHARED_DIR, 'states-{}.arrow'.format(key))
+
+
+def publish(arrays, path):
+
+    table = pa.table([pa.array(arrays[c]) for c in metrics.COLUMNS], names=metrics.COLUMNS)
+
+    # Row ranges and names are small, they go in the schema metadata
+    meta = {
+        'version': arrays['version'],
+        'names': arrays['names'],
+        'starts': arrays['starts'].tolist(),
+        'ends': arrays['ends'].tolist(),
+    }
+    table = table.replace_schema_metadata({'arrays': json.dumps(meta)})
+
+    tmp = path + '.tmp'
+
+    with pa.OSFile(tmp, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    os.replace(tmp, path)
+
+
+def attach(path):
+
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+    meta = json.loads(table.schema.metadata[b'arrays'])
+
+    arrays = {
+        'version': meta['version'],
+        'names': meta['names'],
+        'starts': np.array(meta['starts'], dtype='int64'),
+        'ends': np.array(meta['ends'], dtype='int64'),
+    }
+
+    # Zero copy, the arrays point into the mapped file
+    for c in metrics.COLUMNS:
+        arrays[c] = table.column(c).chunk(0).to_numpy(zero_copy_only=True)
+
+    return arrays
+
+
+def load():
+
+    os.makedirs(SHARED_DIR, exist_ok=True)
+
+    parts = data_store.store_files()
+    path = shared_path(parts)
+
+    if parts and os.path.exists(path):
+        return attach(path)
+
+    with open(LOCK_FILE, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        try:
+            # Another worker may have published while we waited
+            parts = data_store.store_files()
+            path = shared_path(parts)
+
+            if not parts or not os.path.exists(path):
+                df_states = data_store.load_states()
+
+                parts = data_store.store_files()
+                path = shared_path(parts)
+
+                publish(metrics.state_arrays(df_states, revisions=data_store.load_revisions()), path)
+
+                # Workers still on an old file keep their mapping
+                for old in glob.glob(os.path.join(SHARED_DIR, 'states-*.arrow')):
+                    if old != path:
+                        os.remove(old)
+
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+    return attach(path)
+
+########################################################
+
+if __name__ == '__main__':
+
+    arrays = load()
+    print('published {} ({:,} rows)'.format(shared_path(data_store.store_files()), len(arrays['date'])))
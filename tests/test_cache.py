@@ -0,0 +1,28 @@
+import os
+
+import cache
+
+
+def test_disk_entries_stop_at_maxfiles(tmp_path):
+
+    c = cache.ResponseCache(maxsize=100, directory=str(tmp_path), maxfiles=3)
+
+    for i in range(5):
+        c.set('v1', 'key{}'.format(i), b'{}')
+
+    assert len(os.listdir(tmp_path / 'v1')) == 3
+
+    # past the cap entries are still kept in memory, and existing files updated
+    assert c.get('v1', 'key4') == b'{}'
+
+    c.set('v1', 'key0', b'[]')
+    assert cache.ResponseCache(directory=str(tmp_path)).get('v1', 'key0') == b'[]'
+
+
+def test_memory_only_entries_skip_the_disk(tmp_path):
+
+    c = cache.ResponseCache(directory=str(tmp_path))
+    c.set('v1', 'key', b'{}', disk=False)
+
+    assert not os.path.exists(tmp_path / 'v1')
+    assert c.get('v1', 'key') == b'{}'
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+import clean
+import metrics
+
+
+def rows(*data):
+
+    # (state, date, cases, deaths) tuples, sorted the way state_arrays sorts them
+    df = pd.DataFrame(data, columns=['state', 'date', 'cases', 'deaths'])
+    df['date'] = pd.to_datetime(df['date'])
+
+    return df.sort_values(['state', 'date'], kind='mergesort').reset_index(drop=True)
+
+
+def test_dedupe_keeps_the_last_row_and_flags_it():
+
+    df = rows(
+        ('A', '2020-01-01', 1, 0),
+        ('A', '2020-01-02', 2, 0),
+        ('A', '2020-01-02', 3, 0),
+        ('B', '2020-01-01', 5, 1),
+        )
+
+    out, flags = clean.dedupe(df)
+
+    assert out['cases'].tolist() == [1, 3, 5]
+    assert flags.tolist() == [0, clean.DUPLICATE, 0]
+
+
+def test_revise_replaces_counts_and_flags_them():
+
+    df = rows(
+        ('A', '2020-01-01', 1, 0),
+        ('A', '2020-01-02', 2, 0),
+        ('B', '2020-01-01', 5, 1),
+        )
+    revisions = rows(('A', '2020-01-02', 4, 1))
+
+    out, flags = clean.revise(df, np.zeros(3, dtype='uint8'), revisions)
+
+    assert out['cases'].tolist() == [1, 4, 5]
+    assert out['deaths'].tolist() == [0, 1, 1]
+    assert flags.tolist() == [0, clean.REVISED, 0]
+
+    # the frame passed in is left alone
+    assert df['cases'].tolist() == [1, 2, 5]
+
+
+def test_revise_without_revisions_is_a_no_op():
+
+    df = rows(('A', '2020-01-01', 1, 0))
+    flags = np.zeros(1, dtype='uint8')
+
+    out, out_flags = clean.revise(df, flags, None)
+
+    assert out is df
+    assert out_flags is flags
+
+
+def test_fill_gaps_interpolates_missing_days_within_each_state():
+
+    dates = pd.to_datetime(['2020-01-01', '2020-01-04', '2020-01-01', '2020-01-02']).values
+    starts = np.array([0, 2])
+    ends = np.array([2, 4])
+    cases = np.array([10, 40, 7, 8], dtype='int64')
+
+    filled_dates, new_starts, new_ends, (filled,), flags = clean.fill_gaps(
+            dates, starts, ends, [cases], np.zeros(4, dtype='uint8'))
+
+    assert new_starts.tolist() == [0, 4]
+    assert new_ends.tolist() == [4, 6]
+    assert np.datetime_as_string(filled_dates, unit='D').tolist() == [
+            '2020-01-01', '2020-01-02', '2020-01-03', '2020-01-04', '2020-01-01', '2020-01-02']
+    assert filled.tolist() == [10, 20, 30, 40, 7, 8]
+    assert flags.tolist() == [0, clean.GAP, clean.GAP, 0, 0, 0]
+
+
+def test_fill_gaps_without_gaps_returns_the_input():
+
+    dates = pd.to_datetime(['2020-01-01', '2020-01-02']).values
+    cases = np.array([1, 2], dtype='int64')
+
+    out = clean.fill_gaps(dates, np.array([0]), np.array([2]), [cases], np.zeros(2, dtype='uint8'))
+
+    assert out[3][0] is cases
+
+
+def test_correct_holds_drops_at_the_high_water_mark_per_state():
+
+    cum = np.array([5, 9, 7, 8, 12, 3, 2, 4], dtype='int64')
+    starts = np.array([0, 5])
+    ends = np.array([5, 8])
+
+    corrected, negative = clean.correct(cum, starts, ends)
+
+    # the second state starts lower than the first one ended and isn't held up by it
+    assert corrected.tolist() == [5, 9, 9, 9, 12, 3, 3, 4]
+    assert negative.tolist() == [False, False, True, False, False, False, True, False]
+
+
+def test_state_arrays_flags_every_correction():
+
+    df = rows(
+        ('A', '2020-01-01', 10, 1),
+        ('A', '2020-01-02', 8, 1),
+        ('A', '2020-01-02', 9, 1),
+        ('A', '2020-01-04', 30, 2),
+        )
+    df['fips'] = 1
+    df['state'] = df['state'].astype('category')
+
+    arrays = metrics.state_arrays(df)
+
+    assert arrays['raw_cases'].tolist() == [10, 9, 20, 30]
+    assert arrays['cases'].tolist() == [10, 10, 20, 30]
+    assert arrays['new_cases'][1:].tolist() == [0, 10, 10]
+    assert arrays['flags'].tolist() == [0, clean.DUPLICATE | clean.NEGATIVE, clean.GAP, 0]
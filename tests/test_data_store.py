@@ -0,0 +1,143 @@
+import os
+
+import pandas as pd
+import pytest
+
+import data_store
+
+
+def write_snapshot(path, counts):
+
+    # counts is {(date, state): (cases, deaths)}, written in date order
+    lines = ['date,state,fips,cases,deaths']
+
+    for (date, state), (cases, deaths) in sorted(counts.items()):
+        lines.append('{},{},{},{},{}'.format(date, state, 1 if state == 'A' else 2, cases, deaths))
+
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    return str(path)
+
+
+def stored(path):
+
+    # The store as the app sees it, parts with the revisions applied
+    df = data_store.read_parts(path, columns=['date', 'state', 'cases', 'deaths']).astype({'state': str})
+    revisions = data_store.load_revisions(path)
+
+    if revisions is not None:
+        df = pd.concat([df, revisions.astype({'state': str})], ignore_index=True)
+        df = df.drop_duplicates(['date', 'state'], keep='last')
+
+    df = df.sort_values(['date', 'state']).reset_index(drop=True)
+
+    return {(d.strftime('%Y-%m-%d'), s): (c, k) for d, s, c, k in df.itertuples(index=False)}
+
+
+@pytest.fixture
+def snapshots(tmp_path):
+
+    # Three snapshots, each adding a day and restating an earlier one
+    first = {
+        ('2020-12-01', 'A'): (10, 1), ('2020-12-01', 'B'): (20, 2),
+        ('2020-12-02', 'A'): (12, 1), ('2020-12-02', 'B'): (22, 2),
+    }
+    second = dict(first)
+    second.update({('2020-12-02', 'A'): (13, 1), ('2020-12-03', 'A'): (15, 2), ('2020-12-03', 'B'): (25, 2)})
+
+    third = dict(second)
+    third.update({('2020-12-02', 'A'): (14, 1), ('2020-12-03', 'B'): (26, 3), ('2020-12-04', 'A'): (17, 2), ('2020-12-04', 'B'): (27, 3)})
+
+    return [
+        (write_snapshot(tmp_path / 'us-states_{}.csv'.format(i), counts), counts)
+        for i, counts in enumerate([first, second, third])
+        ]
+
+
+def test_read_csv_after_only_parses_later_rows(snapshots):
+
+    src, _ = snapshots[2]
+
+    df = data_store.read_csv_after(src, pd.Timestamp('2020-12-02'), block=16)
+
+    assert sorted(df['date'].dt.strftime('%Y-%m-%d').unique()) == ['2020-12-03', '2020-12-04']
+    assert len(df) == 4
+
+
+def test_updates_in_order_match_the_latest_snapshot(tmp_path, snapshots):
+
+    store = str(tmp_path / 'store')
+
+    for src, _ in snapshots:
+        data_store.update_states(src, store)
+
+    assert stored(store) == snapshots[-1][1]
+    assert len(data_store.store_parts(store)) == 3
+    assert len(data_store.revision_parts(store)) == 2
+
+
+def test_an_older_snapshot_again_changes_nothing(tmp_path, snapshots):
+
+    store = str(tmp_path / 'store')
+
+    for src, _ in snapshots:
+        data_store.update_states(src, store)
+
+    files = data_store.store_files(store)
+
+    # the second snapshot's counts for days the third restated aren't revisions
+    new = data_store.update_states(snapshots[1][0], store)
+    assert not len(new)
+
+    new = data_store.update_states(snapshots[2][0], store)
+    assert not len(new)
+
+    assert data_store.store_files(store) == files
+    assert stored(store) == snapshots[-1][1]
+
+
+def test_a_bad_snapshot_writes_nothing(tmp_path, snapshots):
+
+    store = str(tmp_path / 'store')
+
+    data_store.update_states(snapshots[0][0], store)
+    files = data_store.store_files(store)
+
+    # restates a day and has a negative count on the new one
+    bad = dict(snapshots[0][1])
+    bad.update({('2020-12-02', 'A'): (13, 1), ('2020-12-03', 'A'): (-1, 1)})
+
+    with pytest.raises(ValueError):
+        data_store.update_states(write_snapshot(tmp_path / 'bad.csv', bad), store)
+
+    assert data_store.store_files(store) == files
+    assert stored(store) == snapshots[0][1]
+
+
+def test_restatements_of_old_days_are_revisions(tmp_path):
+
+    store = str(tmp_path / 'store')
+
+    first = {('2020-10-02', 'A'): (5, 0), ('2020-12-01', 'A'): (10, 1)}
+    second = dict(first)
+    second.update({('2020-10-02', 'A'): (6, 0), ('2020-12-02', 'A'): (12, 1)})
+
+    data_store.update_states(write_snapshot(tmp_path / 'first.csv', first), store)
+    data_store.update_states(write_snapshot(tmp_path / 'second.csv', second), store)
+
+    assert stored(store) == second
+    assert len(data_store.revision_parts(store)) == 1
+
+
+def test_full_build_replaces_parts_and_revisions(tmp_path, snapshots):
+
+    store = str(tmp_path / 'store')
+
+    for src, _ in snapshots:
+        data_store.update_states(src, store)
+
+    data_store.build_states(snapshots[1][0], store)
+
+    assert [os.path.basename(p) for p in data_store.store_files(store)] == ['part-0000.feather']
+    assert stored(store) == snapshots[1][1]
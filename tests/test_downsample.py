@@ -0,0 +1,60 @@
+import numpy as np
+
+import downsample
+
+
+def series(n, seed=0):
+
+    # Noisy daily counts with a spike and a dip in the middle
+    y = np.random.default_rng(seed).normal(100, 10, n)
+    y[n // 3] = 1000
+    y[2 * n // 3] = -50
+
+    return y
+
+
+def test_minmax_keeps_the_ends_and_extremes():
+
+    for n in [10, 99, 100, 101, 1000, 1001]:
+        y = series(n)
+        keep = downsample.minmax(y, 20)
+
+        assert keep[0] == 0 and keep[-1] == n - 1
+        assert np.argmax(y) in keep and np.argmin(y) in keep
+        assert len(keep) <= 20
+        assert (np.diff(keep) > 0).all()
+
+
+def test_minmax_keeps_short_series_whole():
+
+    assert downsample.minmax(series(15), 20).tolist() == list(range(15))
+
+
+def test_minmax_ignores_missing_days():
+
+    y = series(300)
+    y[0] = np.nan
+    y[150] = np.nan
+
+    keep = downsample.minmax(y, 20)
+
+    assert keep[0] == 0 and keep[-1] == 299
+    assert 100 in keep and 200 in keep
+
+
+def test_thin_keeps_every_column_and_the_tail():
+
+    cases, deaths = series(730, 1), series(730, 2)
+    deaths[10] = 5000
+
+    keep = downsample.thin([cases, deaths], 100, tail=5)
+
+    assert len(keep) <= 100 + 5
+    assert keep[-5:].tolist() == list(range(725, 730))
+    assert np.argmax(cases) in keep and 10 in keep
+
+
+def test_thin_keeps_every_row_without_points():
+
+    assert downsample.thin([series(50)], 0).tolist() == list(range(50))
+    assert downsample.thin([series(50)], 100).tolist() == list(range(50))
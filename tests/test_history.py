@@ -0,0 +1,116 @@
+import io
+
+import pandas as pd
+import pytest
+
+import history
+
+
+def write_snapshot(path, counts):
+
+    # counts is {(date, state): (cases, deaths)}, written in date order
+    lines = ['date,state,fips,cases,deaths']
+
+    for (date, state), (cases, deaths) in sorted(counts.items()):
+        lines.append('{},{},{},{},{}'.format(date, state, 1 if state == 'A' else 2, cases, deaths))
+
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    return str(path)
+
+
+def published(df):
+
+    return {(d.strftime('%Y-%m-%d'), s): (c, k) for d, s, c, k in df[['date', 'state', 'cases', 'deaths']].astype({'state': str}).itertuples(index=False)}
+
+
+@pytest.fixture
+def store(tmp_path):
+
+    # Three snapshots, the second restates a day and the third restates it
+    # again along with two others, one of them first published in the second
+    first = {
+        ('2020-12-01', 'A'): (10, 1), ('2020-12-01', 'B'): (20, 2),
+        ('2020-12-02', 'A'): (12, 1), ('2020-12-02', 'B'): (22, 2),
+    }
+    second = dict(first)
+    second.update({('2020-12-01', 'B'): (21, 2), ('2020-12-03', 'A'): (15, 2), ('2020-12-03', 'B'): (25, 2)})
+
+    third = dict(second)
+    third.update({('2020-12-01', 'B'): (19, 2), ('2020-12-02', 'A'): (12, 0), ('2020-12-03', 'A'): (16, 2), ('2020-12-04', 'A'): (17, 2), ('2020-12-04', 'B'): (27, 3)})
+
+    counts = [first, second, third]
+    files = [write_snapshot(tmp_path / 'us-states_{}.csv'.format(i), c) for i, c in enumerate(counts)]
+
+    path = str(tmp_path / 'history')
+
+    # in reverse, build orders them by their last date
+    history.build(files[::-1], path)
+
+    return path, counts
+
+
+def test_delta_has_new_and_revised_rows():
+
+    df = history.read_snapshot(io.StringIO(
+        'date,state,fips,cases,deaths\n'
+        '2020-12-01,A,1,10,1\n2020-12-02,A,1,13,1\n2020-12-03,A,1,15,2\n'))
+    known = pd.DataFrame({
+        'date': pd.to_datetime(['2020-12-01', '2020-12-02']),
+        'state': ['A', 'A'],
+        'cases': [10, 12],
+        'deaths': [1, 1],
+    })
+
+    out = history.delta(df, known)
+
+    assert out['date'].dt.strftime('%Y-%m-%d').tolist() == ['2020-12-02', '2020-12-03']
+    assert out['kind'].tolist() == [history.REVISED, history.NEW]
+    assert out['cases'].tolist() == [13, 15]
+
+
+def test_as_of_rebuilds_every_snapshot(store):
+
+    path, counts = store
+
+    snapshots = history.snapshots(path)
+
+    assert [s.strftime('%Y-%m-%d') for s in snapshots] == ['2020-12-02', '2020-12-03', '2020-12-04']
+
+    for snapshot, expected in zip(snapshots, counts):
+        assert published(history.as_of(snapshot, path)) == expected
+
+    assert published(history.as_of(None, path)) == counts[-1]
+
+
+def test_revisions_between_snapshots(store):
+
+    path, _ = store
+    first, second, third = history.snapshots(path)
+
+    out = history.revisions(first, third, path)
+    rows = {(d.strftime('%Y-%m-%d'), s): (c, b, cc, dc) for d, s, c, b, cc, dc in out[['date', 'state', 'cases', 'cases_before', 'cases_change', 'deaths_change']].itertuples(index=False)}
+
+    # the latest count for each day restated since the first snapshot, days
+    # it didn't have yet aren't revisions of it
+    assert rows == {
+        ('2020-12-01', 'B'): (19, 20, -1, 0),
+        ('2020-12-02', 'A'): (12, 12, 0, -1),
+    }
+
+    out = history.revisions(second, third, path)
+    assert sorted(out['date'].dt.strftime('%Y-%m-%d') + out['state']) == ['2020-12-01B', '2020-12-02A', '2020-12-03A']
+    assert out['cases_before'].tolist() == [12, 15, 21]
+
+    assert history.revisions(third, third, path) is None
+
+
+def test_add_refuses_an_older_snapshot(store, tmp_path):
+
+    path, counts = store
+
+    with pytest.raises(ValueError):
+        history.add(write_snapshot(tmp_path / 'old.csv', counts[1]), path)
+
+    assert len(history.history_files(path)) == 3
@@ -0,0 +1,54 @@
+import numpy as np
+
+import query
+
+
+def table(lengths):
+
+    # One state per length, named A, B, ..., with new_cases counting up from
+    # 0 within each state
+    names = [chr(ord('A') + i) for i in range(len(lengths))]
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+
+    pos = np.concatenate([np.arange(n) for n in lengths])
+
+    return query.StateTable({
+        'names': names,
+        'starts': starts,
+        'ends': ends,
+        'date': np.datetime64('2020-01-01') + pos.astype('timedelta64[D]'),
+        'new_cases': pos.astype('float64'),
+        'new_deaths': pos.astype('float64'),
+    })
+
+
+def test_take_nothing():
+
+    out, bounds = table([5, 3]).take([], points=10)
+
+    assert bounds.tolist() == [0]
+    assert all(len(v) == 0 for v in out.values())
+
+
+def test_take_every_row_without_points():
+
+    out, bounds = table([5, 3]).take(['B', 'A'])
+
+    assert bounds.tolist() == [0, 3, 8]
+    assert out['new_cases'].tolist() == [0, 1, 2, 0, 1, 2, 3, 4]
+
+
+def test_take_thins_each_state_and_keeps_its_last_row():
+
+    out, bounds = table([100, 3, 10]).take(['A', 'B', 'C'], points=4)
+
+    for i, n in enumerate([100, 3, 10]):
+        rows = out['new_cases'][bounds[i]:bounds[i + 1]]
+
+        assert rows[0] == 0
+        assert rows[-1] == n - 1
+        assert len(rows) <= min(n, 4) + 1
+
+    # a state shorter than points keeps every row
+    assert out['new_cases'][bounds[1]:bounds[2]].tolist() == [0, 1, 2]
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+#
+#############
+# Transport #
+#############
+#
+# Description: Cheaper callback responses. dash encodes every response with
+# plotly's json encoder, which encodes, decodes and encodes again to turn NaN
+# into null. With orjson installed the callbacks are wrapped to encode their
+# output in one pass instead (numpy arrays natively, NaN as null). Cached
+# responses are also compressed once when they're stored instead of on every
+# request (see cache.py)
+#
+import json
+import gzip
+import functools
+
+import brotli
+import dash
+import plotly
+from dash import _validate
+from dash._utils import stringify_id
+from dash.exceptions import PreventUpdate
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+NoUpdate = type(dash.no_update)
+
+# Content encodings for stored responses, best first
+ENCODINGS = {
+    'br': lambda data: brotli.compress(data, quality=9),
+    'gzip': lambda data: gzip.compress(data, compresslevel=9),
+}
+
+
+def default(o):
+
+    # dash components, then anything plotly's encoder knows about
+    if hasattr(o, 'to_plotly_json'):
+        return o.to_plotly_json()
+
+    return plotly.utils.PlotlyJSONEncoder().default(o)
+
+
+def dumps(obj):
+
+    if orjson is None:
+        return json.dumps(obj, cls=plotly.utils.PlotlyJSONEncoder, separators=(',', ':')).encode()
+
+    return orjson.dumps(obj, default=default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+#################
+# Callbacks     #
+#################
+
+def install(app):
+
+    # Swap dash's wrapper (add_context) for one that encodes with orjson,
+    # plotly's encoder is still used for anything orjson can't encode
+    if orjson is None:
+        return
+
+    for callback_id, entry in app.callback_map.items():
+        func = getattr(entry.get('callback'), '__wrapped__', None)
+
+        if func is not None:
+            entry['callback'] = fast_callback(func, callback_id)
+
+
+def fast_callback(func, callback_id):
+
+    multi = callback_id.startswith('..')
+
+    @functools.wraps(func)
+    def encode(*args, outputs_list):
+
+        values = func(*args)
+
+        if isinstance(values, NoUpdate):
+            raise PreventUpdate
+
+        specs = outputs_list
+
+        if not multi:
+            values, specs = [values], [specs]
+
+        # Dash's own check, so the wrong number of outputs gets dash's error
+        _validate.validate_multi_return(specs, values, callback_id)
+
+        response = {}
+
+        for value, spec in zip(values, specs):
+            if not isinstance(value, NoUpdate):
+                response.setdefault(stringify_id(spec['id']), {})[spec['property']] = value
+
+        if not response:
+            raise PreventUpdate
+
+        response = {'response': response, 'multi': True}
+
+        # The values are encoded again, not the callback run again
+        try:
+            return dumps(response)
+        except TypeError:
+            pass
+
+        try:
+            return json.dumps(response, cls=plotly.utils.PlotlyJSONEncoder)
+        except TypeError:
+            _validate.fail_callback_output(values, callback_id)
+
+    return encode
+
+#################
+# Compression   #
+#################
+
+def accepted(request):
+
+    # Best encoding the client takes, or None
+    accept = request.headers.get('Accept-Encoding', '').lower()
+
+    for encoding in ENCODINGS:
+        if encoding in accept:
+            return encoding
+
+    return None
+
+
+def compress(data, encoding):
+
+    return ENCODINGS[encoding](data)